@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import match_store
+import oncokb_client
+import synthetic_cohorts
+import variant_count
+
+# Times and memory-profiles each stage of variant_count.py on synthetic cohorts at several scales:
+#   read           clinical files and the column-pruned mutation files, unfiltered
+#   key_build      Chromosome,Start,End,Ref,Alt keys for every mutation
+#   match          VUE lookup of the keys, matches and sample maps per cohort
+#   count          per-cohort unique-patient counts
+#   merge          the total over all cohorts, through the match store
+#   json_update    counts written into VUEs.json (OncoKB answers come from a prefilled cache)
+#   read_filtered  the prefiltered read variant_count.py actually does (read + key_build + match)
+#
+#   python benchmark_variant_count.py --scales 1000,10000,100000 --output benchmark.json
+
+def measure(stage_results, name, fn, trace_memory=True):
+    """Run fn() and record its wall time, CPU time and peak traced memory under name."""
+    if trace_memory:
+        tracemalloc.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    result = fn()
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    stage_results[name] = {
+        "wall_seconds": round(wall, 6),
+        "cpu_seconds": round(cpu, 6),
+        "peak_traced_mb": round(peak / 2 ** 20, 3) if peak is not None else None,
+        # ru_maxrss is in KiB on Linux; it is the process high-water mark so far
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10, 3)
+    }
+    return result
+
+def cohort_file_pairs(data_dir):
+    """(clinical_path, mutation_path) pairs per cohort, laid out as in variant_count.cohorts."""
+    pairs = {}
+    for name, paths in variant_count.cohorts.items():
+        if "folder" in paths:
+            pairs[name] = variant_count.find_tcga_file_pairs(os.path.join(data_dir, paths["folder"]))
+        else:
+            pairs[name] = [(os.path.join(data_dir, paths["clinical_path"]), os.path.join(data_dir, paths["mutation_path"]))]
+    return pairs
+
+def read_cohorts(pairs_by_cohort):
+    tables = {}
+    for name, pairs in pairs_by_cohort.items():
+        clinical_df = pd.concat([
+            variant_count.read_clinical_df(clinical_path, name, variant_count.target_gene_panels_by_cohorts)
+            for clinical_path, _ in pairs
+        ], ignore_index=True)
+        mutation_df = pd.concat([
+            chunk for _, mutation_path in pairs
+            for chunk in variant_count.parse_mutation_chunks(mutation_path, variant_count.mutation_chunk_size)
+        ], ignore_index=True)
+        mutation_df['Tumor_Sample_Barcode'] = mutation_df['Tumor_Sample_Barcode'].str.replace("GENIE-MSK-", "", regex=False)
+        mutation_df['row'] = range(len(mutation_df))
+        tables[name] = (clinical_df, mutation_df)
+    return tables
+
+def build_keys(tables):
+    for _, mutation_df in tables.values():
+        mutation_df['genomicLocation'] = variant_count.build_genomic_location(mutation_df)
+
+def match_cohorts(tables, vue_df):
+    return {
+        name: variant_count.process_cohort(clinical_df, mutation_df, vue_df)
+        for name, (clinical_df, mutation_df) in tables.items()
+    }
+
+def count_cohorts(tables, processed, vue_df):
+    results_by_cohort = {}
+    for name, (matches, sample_to_patient, sample_to_cancer_type) in processed.items():
+        clinical_df = tables[name][0]
+        results_by_cohort[name] = {
+            "counts": variant_count.add_vue_counts(
+                vue_df=vue_df,
+                matches=matches,
+                sample_to_cancer_type=sample_to_cancer_type,
+                sample_to_patient=sample_to_patient,
+                total_patients=clinical_df['PATIENT_ID'].nunique()
+            ),
+            "matches": matches,
+            "sample_to_patient": sample_to_patient,
+            "sample_to_cancer_type": sample_to_cancer_type,
+            "patient_ids": clinical_df['PATIENT_ID'].dropna().unique().tolist(),
+            "patient_panels": clinical_df[['PATIENT_ID', 'PANEL']].dropna(subset=['PATIENT_ID']).drop_duplicates().values.tolist(),
+            "patient_cancer_types": clinical_df[['PATIENT_ID', 'CANCER_TYPE']].dropna().drop_duplicates().values.tolist()
+        }
+    return results_by_cohort
+
+def update_json(vues_json_path, vue_df, oncokb_options):
+    with open(vues_json_path, "r", encoding="utf-8") as f:
+        vues_json = json.load(f)
+    updated_vues = variant_count.update_vue_counts_json(vues_json, vue_df, oncokb_options)
+    return len(json.dumps(updated_vues, indent=2, ensure_ascii=False))
+
+def read_filtered(pairs_by_cohort, vue_df):
+    return sum(
+        len(variant_count.read_mutation_df(mutation_path, vue_keys=vue_df.index))
+        for pairs in pairs_by_cohort.values() for _, mutation_path in pairs
+    )
+
+def write_oncokb_cache(path, vue_keys):
+    """A response cache answering every VUE, so the JSON update stage makes no requests."""
+    fetched_at = time.time()
+    oncokb_client.save_response_cache(path, {
+        oncokb_client.cache_source(oncokb_client.default_base_url): {
+            key: {"fetched_at": fetched_at, "annotation": [None, "Unknown"]} for key in vue_keys
+        }
+    })
+
+def benchmark_scale(samples, work_dir, vues_json_path, generator_options, trace_memory=True):
+    data_dir = os.path.join(work_dir, f"samples_{samples}")
+    generate_start = time.perf_counter()
+    synthetic_cohorts.generate(
+        data_dir, synthetic_cohorts.load_vue_keys(vues_json_path), samples=samples, **generator_options
+    )
+    generate_seconds = time.perf_counter() - generate_start
+
+    vue_df = variant_count.load_vue_df(vues_json_path)
+    oncokb_cache = os.path.join(work_dir, "oncokb_cache.json")
+    write_oncokb_cache(oncokb_cache, vue_df.index)
+    pairs_by_cohort = cohort_file_pairs(data_dir)
+
+    stages = {}
+    tables = measure(stages, "read", lambda: read_cohorts(pairs_by_cohort), trace_memory)
+    measure(stages, "key_build", lambda: build_keys(tables), trace_memory)
+    processed = measure(stages, "match", lambda: match_cohorts(tables, vue_df), trace_memory)
+    results_by_cohort = measure(stages, "count", lambda: count_cohorts(tables, processed, vue_df), trace_memory)
+    total_counts = measure(stages, "merge", lambda: variant_count.count_total(
+        vue_df, match_store.build_match_store(results_by_cohort)
+    ), trace_memory)
+
+    for name, result in results_by_cohort.items():
+        vue_df[f'count_{name}'] = [result["counts"][vue] for vue in vue_df.index]
+    vue_df['count_total'] = [total_counts[vue] for vue in vue_df.index]
+    measure(stages, "json_update", lambda: update_json(vues_json_path, vue_df, {"cache_path": oncokb_cache}), trace_memory)
+    matched_rows = measure(stages, "read_filtered", lambda: read_filtered(pairs_by_cohort, vue_df), trace_memory)
+
+    mutation_rows = {name: len(mutation_df) for name, (_, mutation_df) in tables.items()}
+    input_bytes = sum(
+        os.path.getsize(path) for pairs in pairs_by_cohort.values() for pair in pairs for path in pair
+    )
+    return {
+        "samples": samples,
+        "input_bytes": input_bytes,
+        "mutation_rows": mutation_rows,
+        "matched_rows": int(matched_rows),
+        "generate_seconds": round(generate_seconds, 3),
+        "stages": stages
+    }
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the variant_count.py stages on synthetic cohorts.")
+    parser.add_argument("--scales", default="1000,10000,100000",
+                        help="Comma separated MSK-IMPACT sample counts to run (default: %(default)s)")
+    parser.add_argument("--output", default="benchmark_report.json", help="JSON report path (default: %(default)s)")
+    parser.add_argument("--vues", default=variant_count.vues_json_path, help="VUEs.json to count (default: %(default)s)")
+    parser.add_argument("--work-dir", help="Write the synthetic cohorts here and keep them (default: a temp dir)")
+    parser.add_argument("--mutations-per-sample", type=float, default=8.0)
+    parser.add_argument("--vue-hit-rate", type=float, default=0.001)
+    parser.add_argument("--germline-fraction", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-tracemalloc", action="store_true",
+                        help="Skip peak memory tracing, which slows down allocation-heavy stages")
+    args = parser.parse_args()
+
+    generator_options = {
+        "mutations_per_sample": args.mutations_per_sample,
+        "vue_hit_rate": args.vue_hit_rate,
+        "germline_fraction": args.germline_fraction,
+        "seed": args.seed
+    }
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="revue_benchmark_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        results = []
+        for samples in [int(scale) for scale in args.scales.split(",")]:
+            result = benchmark_scale(samples, work_dir, args.vues, generator_options, not args.no_tracemalloc)
+            results.append(result)
+            print(f"{samples} samples: " + ", ".join(
+                f"{name} {stage['wall_seconds']:.2f}s" for name, stage in result["stages"].items()
+            ))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "options": {**generator_options, "tracemalloc": not args.no_tracemalloc},
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+
+# Parsed cohort tables are cached as Parquet, which needs pyarrow (pip install pyarrow)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Bump when the parsed columns or their rendering change, so old entries are rebuilt
+cache_version = 1
+fingerprint_metadata_key = b'revue_cache_fingerprint'
+
+# sha256 digests by absolute path, reused while the file's size and mtime are unchanged. They are
+# kept in <cache_dir>/digests.json (and in the variant_count.py --state file), so unchanged
+# multi-GB inputs are not read again just to validate their cache entries.
+digests = {}
+digests_name = 'digests.json'
+# TCGA study files are read on threads that share the digests
+digests_lock = threading.Lock()
+
+def file_digest(path, digest_cache=None):
+    """sha256 of a file, reused from digest_cache (default: digests) while its size and mtime are unchanged."""
+    digest_cache = digests if digest_cache is None else digest_cache
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    cached = digest_cache.get(key)
+    if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+        return cached["sha256"]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest_cache[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return digest.hexdigest()
+
+def load_digests(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        # Digests computed in this process are newer than the saved ones
+        digests.update({key: entry for key, entry in saved.items() if key not in digests})
+
+def save_digests(path):
+    # Merged with the file on disk, as workers in other processes may have added digests of their own
+    with digests_lock:
+        saved = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**saved, **dict(digests)}, f)
+        os.replace(tmp_path, path)
+
+def file_fingerprint(path):
+    """Source path, size, mtime and sha256 of a file. Any change to one of them invalidates its cache entries."""
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_digest(path)
+    }
+
+def cache_entry_path(cache_dir, path, kind):
+    # One entry per source file and table kind; a stale entry is overwritten in place
+    name = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{kind}-{name}.parquet")
+
+def entry_key(path, kind, columns):
+    return json.dumps({
+        "version": cache_version,
+        "kind": kind,
+        "columns": list(columns) if columns is not None else None,
+        "source": file_fingerprint(path)
+    }, sort_keys=True).encode('utf-8')
+
+def is_valid_entry(entry_path, key):
+    if not os.path.exists(entry_path):
+        return False
+    metadata = pq.read_schema(entry_path).metadata or {}
+    return metadata.get(fingerprint_metadata_key) == key
+
+def to_arrow_table(df, key):
+    # Cached tables are all text columns; a fixed schema keeps all-missing chunks writable
+    schema = pa.schema([(col, pa.string()) for col in df.columns], metadata={fingerprint_metadata_key: key})
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+def cached_chunks(cache_dir, path, kind, columns, read_chunks, chunksize):
+    """Yield the parsed table of path in chunks, from the cache if it is still valid.
+
+    On a miss, read_chunks() parses the source and every chunk is written to a new
+    entry while it is yielded, so the cache never holds the whole table in memory.
+    columns=None caches every column read_chunks() returns.
+    """
+    if pq is None:
+        raise ImportError("--cache-dir requires pyarrow (pip install pyarrow)")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    digests_path = os.path.join(cache_dir, digests_name)
+    load_digests(digests_path)
+    known_digest = digests.get(os.path.abspath(path))
+    entry_path = cache_entry_path(cache_dir, path, kind)
+    key = entry_key(path, kind, columns)
+    if digests.get(os.path.abspath(path)) != known_digest:
+        save_digests(digests_path)
+
+    if is_valid_entry(entry_path, key):
+        for batch in pq.ParquetFile(entry_path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+    writer = None
+    try:
+        for chunk in read_chunks():
+            table = to_arrow_table(chunk if columns is None else chunk[list(columns)], key)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+            yield chunk
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_path, entry_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def cached_table(cache_dir, path, kind, columns, read_table):
+    """Parsed table of path from the cache if it is still valid, otherwise read_table() is cached and returned."""
+    return pd.concat(
+        cached_chunks(cache_dir, path, kind, columns, lambda: [read_table()], chunksize=1 << 20),
+        ignore_index=True
+    )
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import pandas as pd
+import match_store
+
+# Precomputed patient counts for the pub-prep figures, as one long columnar table:
+#   gene, vue, cohort, status, cancer_type -> patients
+# cancer_type is "" for the count over all cancer types. cohort is a cohort or a named union of
+# cohorts (count_cube_groups), de-duplicated by patient as in count_total. Denominators are kept in
+# the file metadata: patients per cohort and cancer type, and genePatientCount per cohort and VUE.
+#
+#   cube = count_cube.load_count_cube('../generated/count_cube.parquet')
+#   count_cube.occurrence(cube, 'total', by=['gene'])
+#   count_cube.percentage(cube, 'mskimpact_genie', by=['gene', 'cancer_type'])
+#
+#   python count_cube.py ../generated/count_cube.parquet total --by gene cancer_type --percentage
+#
+# Parquet needs pyarrow (pip install pyarrow).
+
+# Unions of cohorts used by the figures, in merge order; cohorts missing from a run are skipped
+count_cube_groups = {
+    "mskimpact_combined": ["mskimpact", "mskimpact_nonsignedout"],
+    "mskimpact_genie": ["mskimpact", "mskimpact_nonsignedout", "genie"]
+}
+metadata_key = b'revue_count_cube'
+dimensions = ['gene', 'vue', 'cohort', 'status', 'cancer_type']
+
+def cube_cohorts(store):
+    """Every cohort on its own, the configured unions and the total, as {name: members}."""
+    names = list(store["cohorts"])
+    cohorts = {name: [name] for name in names}
+    for group, members in count_cube_groups.items():
+        members = [name for name in members if name in store["cohorts"]]
+        if members:
+            cohorts[group] = members
+    cohorts["total"] = names
+    return cohorts
+
+def build_count_cube(store, vues_json, panel_index=None):
+    """The count table and its denominators for every cube cohort, from a match store."""
+    gene_by_vue = {
+        vue.get("genomicLocation"): gene.get("hugoGeneSymbol")
+        for gene in vues_json for vue in gene.get("revisedProteinEffects", [])
+    }
+    vue_keys = list(gene_by_vue)
+    rows = []
+    patients = {}
+    gene_patients = {}
+    for cohort, members in cube_cohorts(store).items():
+        counts = match_store.count_patients(store, members, vue_keys, panel_index)
+        for vue, vue_counts in counts.items():
+            for status in match_store.statuses:
+                if vue_counts[f'{status}VariantsCount']:
+                    rows.append((gene_by_vue[vue], vue, cohort, status, "", vue_counts[f'{status}VariantsCount']))
+                for cancer_type, count in vue_counts[f'{status}VariantsCountByCancerType'].items():
+                    rows.append((gene_by_vue[vue], vue, cohort, status, cancer_type, count))
+        patients[cohort] = {"": counts[vue_keys[0]]['totalPatientCount'] if vue_keys else 0}
+        patients[cohort].update(match_store.count_patients_by_cancer_type(store, members))
+        gene_patients[cohort] = {vue: vue_counts['genePatientCount'] for vue, vue_counts in counts.items()}
+
+    table = pd.DataFrame(rows, columns=dimensions + ['patients'])
+    for col in dimensions:
+        table[col] = table[col].astype('category')
+    table['patients'] = table['patients'].astype('int32')
+    return {"counts": table, "patients": patients, "gene_patients": gene_patients}
+
+def write_count_cube(cube, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(cube["counts"], preserve_index=False)
+    metadata = json.dumps({"patients": cube["patients"], "gene_patients": cube["gene_patients"]}).encode('utf-8')
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), metadata_key: metadata})
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+def load_count_cube(path):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
+    metadata = json.loads(table.schema.metadata[metadata_key])
+    return {"counts": table.to_pandas(), "patients": metadata["patients"], "gene_patients": metadata["gene_patients"]}
+
+def select(cube, cohort, statuses=None, genes=None, cancer_types=None):
+    """Count rows of one cohort. Without cancer_types, the all-cancer-type rows are returned."""
+    counts = cube["counts"]
+    mask = counts['cohort'] == cohort
+    if cancer_types is None:
+        mask &= counts['cancer_type'] == ""
+    elif cancer_types == 'all':
+        mask &= counts['cancer_type'] != ""
+    else:
+        mask &= counts['cancer_type'].isin(cancer_types)
+    if statuses is not None:
+        mask &= counts['status'].isin(statuses)
+    if genes is not None:
+        mask &= counts['gene'].isin(genes)
+    return counts[mask]
+
+def occurrence(cube, cohort, by=('gene',), statuses=None, genes=None, cancer_types=None):
+    """Patients summed over statuses, grouped by any of gene, vue, status and cancer_type.
+
+    Like the figures, a patient with a VUE in two statuses is counted once per status.
+    """
+    by = list(by)
+    if 'cancer_type' in by and cancer_types is None:
+        cancer_types = 'all'
+    rows = select(cube, cohort, statuses, genes, cancer_types)
+    return rows.groupby(by, observed=True)['patients'].sum()
+
+def percentage(cube, cohort, by=('gene',), statuses=None, genes=None, cancer_types=None):
+    """occurrence as a percentage of the cohort's patients, per cancer type if grouped by cancer_type.
+
+    When the counts are limited to some cancer types, the denominator is the patients of those
+    cancer types rather than of the whole cohort.
+    """
+    counts = occurrence(cube, cohort, by, statuses, genes, cancer_types)
+    patients = cube["patients"][cohort]
+    if 'cancer_type' in by:
+        denominators = counts.index.get_level_values('cancer_type').map(lambda cancer_type: patients.get(cancer_type))
+        return counts * 100.0 / denominators.to_numpy(dtype=float)
+    if cancer_types is None:
+        return counts * 100.0 / patients[""]
+    if cancer_types == 'all':
+        cancer_types = [cancer_type for cancer_type in patients if cancer_type != ""]
+    return counts * 100.0 / sum(patients.get(cancer_type, 0) for cancer_type in set(cancer_types))
+
+def main():
+    parser = argparse.ArgumentParser(description="Patients with VUEs for a slice of the count cube, as TSV.")
+    parser.add_argument("cube", help="Count cube written by variant_count.py --count-cube")
+    parser.add_argument("cohort", help="Cohort or cohort union (e.g. total, mskimpact_genie)")
+    parser.add_argument("--by", nargs="+", default=["gene"], choices=['gene', 'vue', 'status', 'cancer_type'])
+    parser.add_argument("--statuses", nargs="+", choices=match_store.statuses)
+    parser.add_argument("--genes", nargs="+")
+    parser.add_argument("--cancer-types", nargs="+")
+    parser.add_argument("--percentage", action="store_true", help="Percent of the cohort's patients instead of counts")
+    args = parser.parse_args()
+
+    cube = load_count_cube(args.cube)
+    if args.cohort not in cube["patients"]:
+        parser.error(f"not in the cube: {args.cohort} (available: {', '.join(cube['patients'])})")
+    query = percentage if args.percentage else occurrence
+    result = query(cube, args.cohort, args.by, args.statuses, args.genes, args.cancer_types)
+    print(result.to_frame('percentage' if args.percentage else 'patients').to_csv(sep="\t"), end="")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,31 @@
-import pandas as pd
-import requests
+import argparse
 import json
+import os
 import sys
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import http_session
+
+# Converts a paper's supplementary table (e.g. data/31843900.txt) to VUE JSON, annotated by Genome Nexus.
+# Set GENOME_NEXUS_URL to point it at a mirror or a local mock.
+default_genome_nexus_url = os.environ.get("GENOME_NEXUS_URL", "https://www.genomenexus.org")
 
-# Get input and output file paths from command line arguments
-input_file = sys.argv[1]
-output_file = sys.argv[2]
+parser = argparse.ArgumentParser(description="Convert a supplementary variant table to VUE JSON.")
+parser.add_argument("input_file")
+parser.add_argument("output_file")
+parser.add_argument("--genome-nexus-url", default=default_genome_nexus_url,
+                    help="Genome Nexus base URL (default: %(default)s)")
+parser.add_argument("--batch-size", type=int, default=200,
+                    help="Number of variants per annotation POST (default: 200)")
+parser.add_argument("--workers", type=int, default=4,
+                    help="Number of annotation batches in flight (default: 4)")
+parser.add_argument("--cache",
+                    help="JSON file memoizing annotations across runs, keyed by Genome Nexus URL and HGVSg")
+args = parser.parse_args()
 
 # Step 1: Read TSV file and transform to DataFrame
-df = pd.read_csv(input_file, sep='\t')
+df = pd.read_csv(args.input_file, sep='\t')
 df = df[['gene', 'genotype', 'chr', 'start', 'end', 'ref', 'var', 'transcript_id', 'variant_classification', 'protein_change']]
 
 # Step 2: Generate hgvsg_id and call Genome Nexus API
@@ -21,16 +38,61 @@ def generate_hgvsg_id(row):
 
 df['hgvsg_id'] = df.apply(generate_hgvsg_id, axis=1)
 
-def get_annotation(hgvsg_id):
-    url = f"https://www.genomenexus.org/annotation/{hgvsg_id}?fields=annotation_summary"
-    response = requests.get(url)
-    data = response.json()
+def parse_annotation(data):
     if 'annotation_summary' in data and 'transcriptConsequenceSummary' in data['annotation_summary']:
         return data['annotation_summary']['transcriptConsequenceSummary'].get('variantClassification'), data['annotation_summary']['transcriptConsequenceSummary'].get('hgvspShort'), data['annotation_summary']['genomicLocation'].get('referenceAllele')
     else:
         return None, None, None
 
-df['vep_predicted_variant_classification'], df['vep_predicted_protein_change'], df['ref'] = zip(*df['hgvsg_id'].map(get_annotation))
+def annotate_batch(session, base_url, batch):
+    """Annotations of one batch keyed by HGVSg id, matched by the query each annotation answers."""
+    response = session.post(f"{base_url}/annotation", params={"fields": "annotation_summary"}, json=batch, timeout=120)
+    response.raise_for_status()
+    requested = set(batch)
+    annotations = {}
+    for data in response.json():
+        hgvsg_id = data.get('originalVariantQuery') or data.get('variant')
+        if hgvsg_id in requested:
+            annotations[hgvsg_id] = parse_annotation(data)
+    return annotations
+
+def annotate_batch_or_skip(session, base_url, batch):
+    try:
+        return annotate_batch(session, base_url, batch)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Genome Nexus batch of {len(batch)} failed: {e}", file=sys.stderr)
+        return {}
+
+def get_annotations(hgvsg_ids, base_url, batch_size, workers, cache_path=None):
+    """Annotate unique HGVSg ids with concurrent Genome Nexus batch POSTs. Results are memoized in cache_path if given.
+
+    Failed batches and variants without an annotation summary are not cached, so they are retried on the next run.
+    Annotations are cached per base_url, so a mirror or a mock never answers for another server.
+    """
+    sources = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r') as f:
+            sources = json.load(f).get('sources', {})
+    source = base_url.rstrip('/')
+    cache = sources.get(source, {})
+
+    missing = [hgvsg_id for hgvsg_id in dict.fromkeys(hgvsg_ids) if hgvsg_id not in cache]
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    try:
+        with http_session.create_session(workers, allowed_methods=["GET", "POST"]) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch_annotations in executor.map(lambda batch: annotate_batch_or_skip(session, base_url, batch), batches):
+                cache.update({
+                    hgvsg_id: annotation for hgvsg_id, annotation in batch_annotations.items()
+                    if annotation != (None, None, None)
+                })
+    finally:
+        if cache_path:
+            with open(cache_path, 'w') as f:
+                json.dump({'sources': {**sources, source: cache}}, f)
+    return {hgvsg_id: tuple(cache.get(hgvsg_id, (None, None, None))) for hgvsg_id in hgvsg_ids}
+
+annotations = get_annotations(df['hgvsg_id'], args.genome_nexus_url, args.batch_size, args.workers, args.cache)
+df['vep_predicted_variant_classification'], df['vep_predicted_protein_change'], df['ref'] = zip(*df['hgvsg_id'].map(annotations))
 
 # Step 3: Generate output JSON file
 output = []
@@ -58,5 +120,5 @@ for gene, group in df.groupby('gene'):
         "revisedProteinEffects": revised_protein_effects
     })
 
-with open(output_file, 'w') as f:
+with open(args.output_file, 'w') as f:
     json.dump(output, f)
@@ -1,52 +1,220 @@
-import requests
+import argparse
+import hashlib
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 import requests
-import json
+import http_session
 
 # This is the script to download TCGA pancan data files
-url = "https://api.github.com/repos/cBioPortal/datahub/git/trees/master?recursive=1"
+#
+# Files are streamed to a partial file and renamed into place once complete and verified, so an
+# interrupted run never leaves a truncated file behind and the next run resumes with a Range request.
+# Each output has a sidecar in <target>/.download with the ETag, Last-Modified, size and checksum
+# it was downloaded with; an output whose source is unchanged is skipped.
+#
+# The data files are stored in Git LFS. Their checksum is the sha256 oid of the LFS pointer file;
+# files that are not in LFS are checked against the git blob sha1 from the tree listing.
+tree_url = "https://api.github.com/repos/cBioPortal/datahub/git/trees/master?recursive=1"
+media_url = "https://media.githubusercontent.com/media/cBioPortal/datahub/master"
+raw_url = "https://raw.githubusercontent.com/cBioPortal/datahub/master"
 
 # Target path to save the files
 target_path = "./files/tcga"
 
-# Send a GET request to the GitHub API
-response = requests.get(url)
-data = response.json()
-
-# Filter the data for tree type (which represents directories)
-directories = [item for item in data['tree'] if item['type'] == 'tree']
-
-# Filter directories that contain "tcga_pan_can_atlas_2018" in their path
-tcga_dirs = [dir for dir in directories if dir['path'].endswith("tcga_pan_can_atlas_2018")]
-
-# Print the count of such directories
-print(f"Found {len(tcga_dirs)} directories.")
-
-# Go to each directory "data_mutations.txt" and "data_clinical_sample.txt"
-for directory in tcga_dirs:
-    # Construct the raw URL of the file
-    print(directory['path'][7:])
-    mutation_file_url = f"https://media.githubusercontent.com/media/cBioPortal/datahub/master/{directory['path']}/data_mutations.txt"
-    clinical_file_url = f"https://media.githubusercontent.com/media/cBioPortal/datahub/master/{directory['path']}/data_clinical_sample.txt"
-    
-    mutation_file_response = requests.get(mutation_file_url)
-    clinical_file_response = requests.get(clinical_file_url)
-
-    if mutation_file_response.status_code == 200:
-        mutation_filename = os.path.join(target_path, directory['path'].split('/')[-1] + "_mutations.txt")
-        with open(mutation_filename, 'wb') as f:
-            f.write(mutation_file_response.content)
-        print(f"Downloaded file to {mutation_filename}")
-    else:
-        print(f"No 'data_mutations.txt' found in {directory['path']}")
-    
-    if clinical_file_response.status_code == 200:
-        clinical_filename = os.path.join(target_path, directory['path'].split('/')[-1] + "_clinical_samples.txt")
-        with open(clinical_filename, 'wb') as f:
-            lines = clinical_file_response.content.splitlines()
-            for line in lines[4:]:
-                f.write(line + b'\n')
-
-        print(f"Downloaded file to {clinical_filename}")
+# source file name -> (output suffix, header lines to drop)
+study_files = {
+    "data_mutations.txt": ("_mutations.txt", 0),
+    # The clinical file starts with 4 metadata lines before the column header
+    "data_clinical_sample.txt": ("_clinical_samples.txt", 4)
+}
+chunk_size = 1 << 20
+# LFS pointer files are a few lines of text; anything larger in the tree is the data itself
+max_pointer_size = 1024
+
+def list_study_files(session, tree_url):
+    """Tree entries of the study files in every *tcga_pan_can_atlas_2018 directory, as (directory, name, blob)."""
+    response = session.get(tree_url, timeout=60)
+    response.raise_for_status()
+    tree = response.json()['tree']
+    blobs = {item['path']: item for item in tree if item['type'] == 'blob'}
+
+    # Filter directories that contain "tcga_pan_can_atlas_2018" in their path
+    tcga_dirs = [item['path'] for item in tree if item['type'] == 'tree' and item['path'].endswith("tcga_pan_can_atlas_2018")]
+    print(f"Found {len(tcga_dirs)} directories.")
+    return [
+        (directory, name, blobs.get(f"{directory}/{name}"))
+        for directory in tcga_dirs for name in study_files
+    ]
+
+def parse_lfs_pointer(text):
+    fields = dict(line.split(' ', 1) for line in text.splitlines() if ' ' in line)
+    if not fields.get('oid', '').startswith('sha256:'):
+        return None
+    return {"algorithm": "sha256", "digest": fields['oid'][len('sha256:'):], "size": int(fields['size'])}
+
+def expected_checksum(session, raw_url, path, blob):
+    """Checksum of the file's content: the LFS oid for pointer files, otherwise the git blob sha1.
+
+    None if the blob may be an LFS pointer but the pointer could not be fetched; the download is
+    then not verified, rather than checked against the sha1 of the pointer.
+    """
+    if blob is None:
+        return None
+    if blob.get('size', 0) <= max_pointer_size:
+        response = session.get(f"{raw_url}/{path}", timeout=60)
+        if response.status_code != 200:
+            print(f"Could not fetch {raw_url}/{path} (HTTP {response.status_code}); {path} will not be verified")
+            return None
+        checksum = parse_lfs_pointer(response.text)
+        if checksum is not None:
+            return checksum
+    return {"algorithm": "git-sha1", "digest": blob['sha'], "size": blob.get('size')}
+
+def new_hasher(checksum):
+    if checksum is not None and checksum["algorithm"] == "git-sha1":
+        hasher = hashlib.sha1()
+        hasher.update(f"blob {checksum['size']}\0".encode())
+        return hasher
+    return hashlib.sha256()
+
+def load_sidecar(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_sidecar(path, sidecar):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, indent=2)
+    os.replace(tmp_path, path)
+
+def download_to_part(session, url, part_path, sidecar_path, sidecar, checksum):
+    """Stream url into part_path, resuming an earlier partial download of the same version.
+
+    Returns (response, hasher of the whole part file), or (None, None) if the server answered 304 Not Modified.
+    """
+    headers = {}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = sidecar.get("partial_etag") or sidecar.get("partial_last_modified")
+    if offset and validator:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    elif "output_size" in sidecar:
+        # Ask for the body only if it changed since the completed download
+        if sidecar.get("etag"):
+            headers["If-None-Match"] = sidecar["etag"]
+        if sidecar.get("last_modified"):
+            headers["If-Modified-Since"] = sidecar["last_modified"]
+
+    with session.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            return None, None
+        if response.status_code == 416:
+            # The partial file is not a prefix of the current version; start over
+            os.remove(part_path)
+            return download_to_part(session, url, part_path, sidecar_path, {}, checksum)
+        if response.status_code not in (200, 206):
+            return response, None
+        # Saved before the body is read, so an interrupted download can be resumed
+        sidecar["partial_etag"] = response.headers.get("ETag")
+        sidecar["partial_last_modified"] = response.headers.get("Last-Modified")
+        save_sidecar(sidecar_path, sidecar)
+
+        hasher = new_hasher(checksum)
+        if response.status_code == 206:
+            # Hash the bytes downloaded before, then append
+            with open(part_path, "rb") as f:
+                for block in iter(lambda: f.read(chunk_size), b""):
+                    hasher.update(block)
+        with open(part_path, "ab" if response.status_code == 206 else "wb") as f:
+            for block in response.iter_content(chunk_size=chunk_size):
+                f.write(block)
+                hasher.update(block)
+        return response, hasher
+
+def write_output(part_path, output_path, skip_lines):
+    """Move the verified download into place, dropping skip_lines header lines. Returns the output size."""
+    if skip_lines:
+        tmp_path = f"{output_path}.tmp"
+        with open(part_path, "rb") as source, open(tmp_path, "wb") as f:
+            for i, line in enumerate(source):
+                if i >= skip_lines:
+                    f.write(line.rstrip(b'\r\n') + b'\n')
+        os.replace(tmp_path, output_path)
+        os.remove(part_path)
     else:
-        print(f"No 'data_mutations.txt' found in {directory['path']}")
+        os.replace(part_path, output_path)
+    return os.path.getsize(output_path)
+
+def download_study_file(session, directory, name, blob, options):
+    """Download one study file unless it is unchanged. Returns a one-line status message."""
+    suffix, skip_lines = study_files[name]
+    output_name = directory.split('/')[-1] + suffix
+    output_path = os.path.join(options["target_path"], output_name)
+    sidecar_path = os.path.join(options["target_path"], ".download", output_name + ".json")
+    part_path = os.path.join(options["target_path"], ".download", output_name + ".part")
+    sidecar = load_sidecar(sidecar_path)
+    path = f"{directory}/{name}"
+
+    checksum = expected_checksum(session, options["raw_url"], path, blob)
+    is_complete = os.path.exists(output_path) and os.path.getsize(output_path) == sidecar.get("output_size")
+    if not is_complete:
+        sidecar.pop("output_size", None)
+    if is_complete and checksum is not None and sidecar.get("checksum") == checksum:
+        return f"Unchanged {output_path}"
+
+    response, hasher = download_to_part(
+        session, f"{options['media_url']}/{path}", part_path, sidecar_path, sidecar, checksum
+    )
+    if response is None:
+        return f"Not modified {output_path}"
+    if hasher is None:
+        return f"No '{name}' found in {directory} (HTTP {response.status_code})"
+
+    size = os.path.getsize(part_path)
+    if checksum is not None:
+        if hasher.hexdigest() != checksum["digest"] or (checksum["size"] is not None and size != checksum["size"]):
+            os.remove(part_path)
+            save_sidecar(sidecar_path, {})
+            raise ValueError(f"Checksum mismatch for {path}: expected {checksum['algorithm']} {checksum['digest']}")
+
+    output_size = write_output(part_path, output_path, skip_lines)
+    save_sidecar(sidecar_path, {
+        "url": response.url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "size": size,
+        "checksum": checksum,
+        "output_size": output_size
+    })
+    return f"Downloaded file to {output_path}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the TCGA PanCan Atlas mutation and clinical sample files.")
+    parser.add_argument("--target", default=target_path, help="Directory to save the files in (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent downloads (default: 8)")
+    parser.add_argument("--tree-url", default=tree_url, help="GitHub tree listing of the datahub repository")
+    parser.add_argument("--media-url", default=media_url, help="Base URL of the file contents (LFS media)")
+    parser.add_argument("--raw-url", default=raw_url, help="Base URL of the raw repository files (LFS pointers)")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(args.target, ".download"), exist_ok=True)
+    options = {"target_path": args.target, "media_url": args.media_url.rstrip('/'), "raw_url": args.raw_url.rstrip('/')}
+    with http_session.create_session(pool_size=args.workers) as session:
+        files = list_study_files(session, args.tree_url)
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(download_study_file, session, *file, options) for file in files]
+            failures = 0
+            for future in futures:
+                try:
+                    print(future.result())
+                except (requests.RequestException, ValueError, OSError) as e:
+                    failures += 1
+                    print(e)
+    if failures:
+        raise SystemExit(f"{failures} of {len(files)} files failed")
+
+if __name__ == "__main__":
+    main()
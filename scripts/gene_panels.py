@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# Gene panel coverage for the genePatientCount denominator: the number of patients with at least
+# one sample sequenced on an assay that covers the VUE position.
+#
+# Panels are read from a GENIE-style genomic_information.txt (one row per targeted interval, with
+# Chromosome, Start_Position, End_Position and SEQ_ASSAY_ID). GENIE names the MSK-IMPACT assays
+# MSK-IMPACT468 etc. while the MSK-IMPACT clinical file says IMPACT468, so the MSK- prefix is dropped
+# from both, as GENIE-MSK- is dropped from sample ids.
+#
+# Samples without a panel (TCGA whole exomes), and samples on a panel that is not in the
+# definitions, are counted as covering every VUE.
+whole_genome = '*'
+panel_columns = ['Chromosome', 'Start_Position', 'End_Position', 'SEQ_ASSAY_ID', 'includeInPanel']
+
+def normalize_panel_name(panel):
+    if not isinstance(panel, str):
+        return whole_genome
+    return panel[len('MSK-'):] if panel.startswith('MSK-') else panel
+
+def read_panel_intervals(path):
+    df = pd.read_csv(path, sep="\t", usecols=lambda col: col in panel_columns, dtype=str)
+    if 'includeInPanel' in df.columns:
+        df = df[df['includeInPanel'].str.upper() != 'FALSE']
+    return pd.DataFrame({
+        'chromosome': df['Chromosome'].str.replace(r'^chr', '', regex=True),
+        'start': pd.to_numeric(df['Start_Position'], errors='coerce'),
+        'end': pd.to_numeric(df['End_Position'], errors='coerce'),
+        'panel': df['SEQ_ASSAY_ID'].map(normalize_panel_name)
+    }).dropna()
+
+def build_panel_index(intervals):
+    """Per-chromosome panel intervals sorted by start, built once for all VUEs and cohorts."""
+    panels = sorted(intervals['panel'].unique())
+    panel_codes = pd.Categorical(intervals['panel'], categories=panels).codes
+    index = {"panels": panels, "chromosomes": {}}
+    for chromosome, rows in intervals.assign(code=panel_codes).groupby('chromosome'):
+        rows = rows.sort_values('start')
+        starts, ends = rows['start'].to_numpy(dtype=float), rows['end'].to_numpy(dtype=float)
+        index["chromosomes"][chromosome] = {
+            "starts": starts,
+            "ends": ends,
+            "panels": rows['code'].to_numpy(),
+            "max_length": float((ends - starts).max())
+        }
+    return index
+
+def vue_panel_coverage(index, vue_keys):
+    """Boolean VUE x panel matrix: True where the panel has an interval overlapping the VUE."""
+    coverage = np.zeros((len(vue_keys), len(index["panels"])), dtype=bool)
+    for i, key in enumerate(vue_keys):
+        # Null or malformed keys are covered by no panel
+        try:
+            chromosome, start, end = key.split(',')[:3]
+            start, end = float(start), float(end)
+        except (AttributeError, ValueError):
+            continue
+        entry = index["chromosomes"].get(chromosome[3:] if chromosome.startswith('chr') else chromosome)
+        if entry is None:
+            continue
+        # Candidates start at most max_length before the VUE and no later than its end
+        lo = np.searchsorted(entry["starts"], start - entry["max_length"], side='left')
+        hi = np.searchsorted(entry["starts"], end, side='right')
+        overlaps = entry["ends"][lo:hi] >= start
+        coverage[i, entry["panels"][lo:hi][overlaps]] = True
+    return coverage
+
+def count_covered_patients(index, vue_keys, patient_ids, panels):
+    """Patients covered at each VUE, from parallel (patient_id, panel) sequences. Returns {vue: count}.
+
+    Patients are grouped by their set of panels, so the work is one small matrix product over the
+    distinct panel combinations rather than a pass over patients per VUE.
+    """
+    pairs = pd.DataFrame({'patient': patient_ids, 'panel': pd.Series(panels, dtype=object).map(normalize_panel_name)})
+    pairs = pairs.dropna(subset=['patient']).drop_duplicates()
+    if index is None or pairs.empty:
+        return {vue: int(pairs['patient'].nunique()) for vue in vue_keys}
+
+    # Unknown panels and whole exomes get a column that covers every VUE
+    known = pairs['panel'].isin(index["panels"])
+    panel_names = index["panels"] + [whole_genome]
+    panel_codes = np.where(known, pd.Categorical(pairs['panel'], categories=index["panels"]).codes, len(index["panels"]))
+    patient_codes = pd.factorize(pairs['patient'])[0]
+    coverage = np.hstack([vue_panel_coverage(index, vue_keys), np.ones((len(vue_keys), 1), dtype=bool)])
+
+    patient_panels = np.zeros((patient_codes.max() + 1, len(panel_names)), dtype=bool)
+    patient_panels[patient_codes, panel_codes] = True
+    combinations, patients_per_combination = np.unique(patient_panels, axis=0, return_counts=True)
+    covered = (combinations.astype(np.int32) @ coverage.T.astype(np.int32)) > 0
+    counts = patients_per_combination @ covered
+    return {vue: int(count) for vue, count in zip(vue_keys, counts)}
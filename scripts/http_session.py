@@ -0,0 +1,24 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Pooled HTTP session shared by the scripts that call remote APIs (OncoKB, Genome Nexus, datahub)
+
+def create_session(pool_size=8, retries=5, backoff_factor=1.0, allowed_methods=Retry.DEFAULT_ALLOWED_METHODS):
+    """Session with a connection pool and retry/backoff on rate limits (429, honoring Retry-After) and 5xx.
+
+    Only idempotent methods are retried by default; pass allowed_methods to also retry POST.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(allowed_methods),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -0,0 +1,91 @@
+import numpy as np
+
+# How mutations are matched to VUEs:
+#   exact       the Chromosome,Start,End,Ref,Alt key must be equal (default)
+#   normalized  equal after trimming bases shared by ref and alt (e.g. VCF-style anchored indels)
+#   overlap     any VUE whose normalized interval overlaps the mutation's normalized interval
+match_modes = ['exact', 'normalized', 'overlap']
+
+def normalize_alleles(start, end, ref, alt):
+    """Trim bases shared by ref and alt and return MAF-style (start, end, ref, alt), with '-' for an empty allele."""
+    ref = '' if ref == '-' else ref
+    alt = '' if alt == '-' else alt
+
+    prefix = 0
+    while prefix < min(len(ref), len(alt)) and ref[prefix] == alt[prefix]:
+        prefix += 1
+    ref, alt = ref[prefix:], alt[prefix:]
+    suffix = 0
+    while suffix < min(len(ref), len(alt)) and ref[-1 - suffix] == alt[-1 - suffix]:
+        suffix += 1
+    ref, alt = ref[:len(ref) - suffix], alt[:len(alt) - suffix]
+
+    start += prefix
+    if not ref:
+        # Insertions are placed between the two flanking bases; a trimmed anchor base is the left flank
+        if prefix:
+            start -= 1
+        end = start + 1
+    else:
+        end = start + len(ref) - 1
+    return start, end, ref or '-', alt or '-'
+
+def normalize_chromosome(chromosome):
+    return chromosome[3:] if chromosome.startswith('chr') else chromosome
+
+def build_interval_index(vue_keys):
+    """Per-chromosome arrays of normalized VUE intervals sorted by start, for O(log n) lookups."""
+    records_by_chromosome = {}
+    for key in vue_keys:
+        # Null keys and keys without the five Chromosome,Start,End,Ref,Alt fields are skipped
+        try:
+            chromosome, start, end, ref, alt = key.split(',')
+            start, end, ref, alt = normalize_alleles(int(start), int(end), ref, alt)
+        except (AttributeError, ValueError):
+            continue
+        records_by_chromosome.setdefault(normalize_chromosome(chromosome), []).append((start, end, ref, alt, key))
+
+    index = {}
+    for chromosome, records in records_by_chromosome.items():
+        records.sort(key=lambda record: record[0])
+        starts = np.array([record[0] for record in records], dtype=float)
+        ends = np.array([record[1] for record in records], dtype=float)
+        index[chromosome] = {
+            "starts": starts,
+            "ends": ends,
+            "alleles": [(record[2], record[3]) for record in records],
+            "keys": [record[4] for record in records],
+            "max_length": float((ends - starts).max())
+        }
+    return index
+
+def match_mutations(index, chromosome, start, end, ref, alt, mode):
+    """Match mutation columns (numpy arrays; start/end as floats, NaN if missing) against the index.
+
+    Returns (rows, keys): the row position of every matching mutation and the VUE key it matched,
+    in row order. A mutation can match several VUEs in overlap mode.
+    """
+    rows, keys = [], []
+    for index_chromosome, entry in index.items():
+        in_chromosome = np.flatnonzero((chromosome == index_chromosome) & np.isfinite(start) & np.isfinite(end))
+        # Normalizing only shrinks the raw interval, except for an anchored insertion which can
+        # move one base to the right, so [start, end + 1] bounds every candidate
+        query_start = start[in_chromosome] - entry["max_length"]
+        query_end = end[in_chromosome] + 1
+        lo = np.searchsorted(entry["starts"], query_start, side='left')
+        hi = np.searchsorted(entry["starts"], query_end, side='right')
+        has_candidates = hi > lo
+
+        for row, first, last in zip(in_chromosome[has_candidates], lo[has_candidates], hi[has_candidates]):
+            mutation = normalize_alleles(int(start[row]), int(end[row]), ref[row], alt[row])
+            for i in range(first, last):
+                if mode == 'overlap':
+                    is_match = entry["starts"][i] <= mutation[1] and entry["ends"][i] >= mutation[0]
+                else:
+                    is_match = (entry["starts"][i], entry["ends"][i], *entry["alleles"][i]) == mutation
+                if is_match:
+                    rows.append(row)
+                    keys.append(entry["keys"][i])
+
+    order = np.argsort(rows, kind='stable')
+    return np.array(rows, dtype=int)[order], [keys[i] for i in order]
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+import gene_panels
+
+# Per-cohort VUE matches encoded over ID spaces shared by all cohorts, so the de-duplicated
+# counts of any combination of cohorts are computed from the stored codes without re-reading inputs.
+# Sample and patient ids are read with the GENIE-MSK- prefix removed, so an MSK-IMPACT patient
+# released again in GENIE has the same patient code in both cohorts.
+#
+# Per cohort:
+#   vue, sample, status      one entry per (VUE, sample, mutation status) match, in file order.
+#                            A sample is counted under one status: that of its last match, in the
+#                            last cohort that matched it
+#   patient_sample, patient  sample -> patient, for the matched samples
+#   cancer_type_sample,      sample -> cancer type for every clinical sample (-1 if missing)
+#   cancer_type
+#   patients                 every patient in the cohort (for totalPatientCount)
+#   panel_patient, panel     the (patient, gene panel) pairs of the cohort (for genePatientCount)
+#   cancer_type_patient,     the (patient, cancer type) pairs of the cohort (patients per cancer type)
+#   patient_cancer_type
+#
+#   python match_store.py ../generated/match_store.npz mskimpact genie --output mskimpact_genie_counts.json
+
+statuses = ['germline', 'somatic', 'unknown']
+id_spaces = ['vues', 'samples', 'patients', 'cancer_types', 'panels']
+cohort_arrays = [
+    'vue', 'sample', 'status', 'patient_sample', 'patient', 'cancer_type_sample', 'cancer_type', 'patients',
+    'panel_patient', 'panel', 'cancer_type_patient', 'patient_cancer_type'
+]
+
+def empty_vue_counts(total_patients):
+    return {
+        'germlineVariantsCount': 0,
+        'somaticVariantsCount': 0,
+        'unknownVariantsCount': 0,
+        'germlineVariantsCountByCancerType': {},
+        'somaticVariantsCountByCancerType': {},
+        'unknownVariantsCountByCancerType': {},
+        'totalPatientCount': total_patients,
+        'genePatientCount': total_patients
+    }
+
+def status_codes(mutation_status):
+    # gemrline, somatic, unknown
+    lowered = mutation_status.fillna('unknown').astype(str).str.lower()
+    return pd.Categorical(lowered.where(lowered.isin(statuses), 'unknown'), categories=statuses).codes
+
+def build_match_store(results_by_cohort):
+    """Encode the results of run_cohorts (matches and sample maps per cohort) over shared ID spaces."""
+    def factorize(values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=True)
+        return codes.astype(np.int32), list(uniques)
+
+    names = list(results_by_cohort)
+    results = list(results_by_cohort.values())
+    # Encode every id column of every cohort at once, then split the codes back per cohort
+    columns = {
+        'vue': [result["matches"]['vue'] for result in results],
+        'sample': [result["matches"]['sample_id'] for result in results],
+        'patient_sample': [list(result["sample_to_patient"]) for result in results],
+        'patient': [list(result["sample_to_patient"].values()) for result in results],
+        'cancer_type_sample': [list(result["sample_to_cancer_type"]) for result in results],
+        'cancer_type': [list(result["sample_to_cancer_type"].values()) for result in results],
+        'patients': [result["patient_ids"] for result in results],
+        'panel_patient': [[patient for patient, _ in result["patient_panels"]] for result in results],
+        # Samples without a panel are stored as the whole genome panel
+        'panel': [[gene_panels.normalize_panel_name(panel) for _, panel in result["patient_panels"]] for result in results],
+        'cancer_type_patient': [[patient for patient, _ in result["patient_cancer_types"]] for result in results],
+        'patient_cancer_type': [[cancer_type for _, cancer_type in result["patient_cancer_types"]] for result in results]
+    }
+    lengths = {column: [len(values) for values in parts] for column, parts in columns.items()}
+
+    def concat(column):
+        return [value for values in columns[column] for value in values]
+
+    vue_codes, vues = factorize(concat('vue'))
+    sample_codes, samples = factorize(concat('sample') + concat('patient_sample') + concat('cancer_type_sample'))
+    patient_codes, patients = factorize(
+        concat('patient') + concat('patients') + concat('panel_patient') + concat('cancer_type_patient')
+    )
+    cancer_type_codes, cancer_types = factorize(concat('cancer_type') + concat('patient_cancer_type'))
+    panel_codes, panels = factorize(concat('panel'))
+
+    n_sample, n_patient_sample = sum(lengths['sample']), sum(lengths['patient_sample'])
+    n_patient, n_patients = sum(lengths['patient']), sum(lengths['patients'])
+    n_panel_patient, n_cancer_type = sum(lengths['panel_patient']), sum(lengths['cancer_type'])
+    codes = {
+        'vue': vue_codes,
+        'sample': sample_codes[:n_sample],
+        'patient_sample': sample_codes[n_sample:n_sample + n_patient_sample],
+        'cancer_type_sample': sample_codes[n_sample + n_patient_sample:],
+        'patient': patient_codes[:n_patient],
+        'patients': patient_codes[n_patient:n_patient + n_patients],
+        'panel_patient': patient_codes[n_patient + n_patients:n_patient + n_patients + n_panel_patient],
+        'cancer_type_patient': patient_codes[n_patient + n_patients + n_panel_patient:],
+        'cancer_type': cancer_type_codes[:n_cancer_type],
+        'patient_cancer_type': cancer_type_codes[n_cancer_type:],
+        'panel': panel_codes
+    }
+
+    cohorts = {}
+    for i, name in enumerate(names):
+        cohort = {}
+        for column, column_codes in codes.items():
+            start = sum(lengths[column][:i])
+            cohort[column] = column_codes[start:start + lengths[column][i]]
+        cohort['status'] = status_codes(results[i]["matches"]['mutation_status']).astype(np.int8)
+        cohorts[name] = cohort
+
+    return {
+        "ids": {"vues": vues, "samples": samples, "patients": patients, "cancer_types": cancer_types, "panels": panels},
+        "cohorts": cohorts
+    }
+
+def save_match_store(store, path):
+    arrays = {
+        f"cohort/{name}/{column}": values
+        for name, cohort in store["cohorts"].items() for column, values in cohort.items()
+    }
+    for id_space, values in store["ids"].items():
+        arrays[f"ids/{id_space}"] = np.array(values, dtype=object).astype(str)
+    arrays["cohorts"] = np.array(list(store["cohorts"]), dtype=str)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def load_match_store(path):
+    with np.load(path) as data:
+        return {
+            "ids": {id_space: data[f"ids/{id_space}"].tolist() for id_space in id_spaces},
+            "cohorts": {
+                name: {column: data[f"cohort/{name}/{column}"] for column in cohort_arrays}
+                for name in data["cohorts"].tolist()
+            }
+        }
+
+def count_patients(store, cohort_names, vue_keys=None, panel_index=None):
+    """Unique-patient counts per VUE over the union of cohort_names, as variant_count.add_vue_counts returns them.
+
+    Cohorts are merged in the given order: a sample's patient, cancer type and mutation status come
+    from the last cohort that has them (the status of the sample's last match in that cohort), and a
+    patient counted for a VUE and status gets the cancer type of its first matched sample. With a
+    panel_index, genePatientCount counts the patients with any panel covering the VUE, over the
+    (patient, panel) pairs of all the cohorts.
+    """
+    vues = store["ids"]["vues"]
+    n_samples, n_patients = len(store["ids"]["samples"]), len(store["ids"]["patients"])
+    cohorts = [store["cohorts"][name] for name in cohort_names]
+
+    patient_of = np.full(n_samples, -1, dtype=np.int64)
+    cancer_type_of = np.full(n_samples, -1, dtype=np.int64)
+    status_of = np.full(n_samples, -1, dtype=np.int64)
+    for cohort in cohorts:
+        # The last match of each sample is the first one in reverse order
+        has_sample = cohort['sample'] >= 0
+        last_samples, last = np.unique(cohort['sample'][has_sample][::-1], return_index=True)
+        status_of[last_samples] = cohort['status'][has_sample][::-1][last]
+        # Code -1 is a missing id
+        has_sample = cohort['patient_sample'] >= 0
+        patient_of[cohort['patient_sample'][has_sample]] = cohort['patient'][has_sample]
+        has_sample = cohort['cancer_type_sample'] >= 0
+        cancer_type_of[cohort['cancer_type_sample'][has_sample]] = cohort['cancer_type'][has_sample]
+    total_patients = len(np.unique(np.concatenate([cohort['patients'] for cohort in cohorts] + [np.array([], dtype=np.int32)])))
+
+    vue = np.concatenate([cohort['vue'] for cohort in cohorts]).astype(np.int64)
+    sample = np.concatenate([cohort['sample'] for cohort in cohorts]).astype(np.int64)
+    patient = np.where(sample >= 0, patient_of[sample], -1)
+    has_patient = patient >= 0
+    vue, sample, patient = vue[has_patient], sample[has_patient], patient[has_patient]
+    status = status_of[sample]
+
+    # Keep the first match of each (vue, status, patient); np.unique returns first occurrences
+    vue_status = vue * len(statuses) + status
+    _, first = np.unique(vue_status * n_patients + patient, return_index=True)
+    vue_status, cancer_type = vue_status[first], cancer_type_of[sample[first]]
+    status_keys, status_counts = np.unique(vue_status, return_counts=True)
+    has_cancer_type = cancer_type >= 0
+    cancer_type_keys, cancer_type_counts = np.unique(
+        vue_status[has_cancer_type] * len(store["ids"]["cancer_types"]) + cancer_type[has_cancer_type],
+        return_counts=True
+    )
+
+    vue_keys = vues if vue_keys is None else vue_keys
+    counts = {vue_key: empty_vue_counts(total_patients) for vue_key in vue_keys}
+    if panel_index is not None:
+        panel_names = np.array(store["ids"]["panels"] + [None], dtype=object)
+        gene_patient_counts = gene_panels.count_covered_patients(
+            panel_index, vue_keys,
+            np.concatenate([cohort['panel_patient'] for cohort in cohorts]),
+            panel_names[np.concatenate([cohort['panel'] for cohort in cohorts])]
+        )
+        for vue_key in vue_keys:
+            counts[vue_key]['genePatientCount'] = gene_patient_counts[vue_key]
+    for key, count in zip(status_keys.tolist(), status_counts.tolist()):
+        vue_key = vues[key // len(statuses)]
+        if vue_key in counts:
+            counts[vue_key][f'{statuses[key % len(statuses)]}VariantsCount'] = count
+    for key, count in zip(cancer_type_keys.tolist(), cancer_type_counts.tolist()):
+        key, cancer_type_code = divmod(key, len(store["ids"]["cancer_types"]))
+        vue_key = vues[key // len(statuses)]
+        if vue_key in counts:
+            status_name = statuses[key % len(statuses)]
+            counts[vue_key][f'{status_name}VariantsCountByCancerType'][store["ids"]["cancer_types"][cancer_type_code]] = count
+    return counts
+
+def count_patients_by_cancer_type(store, cohort_names):
+    """Unique patients per cancer type over the union of cohort_names, as {cancer_type: count}."""
+    cohorts = [store["cohorts"][name] for name in cohort_names]
+    patient = np.concatenate([cohort['cancer_type_patient'] for cohort in cohorts]).astype(np.int64)
+    cancer_type = np.concatenate([cohort['patient_cancer_type'] for cohort in cohorts]).astype(np.int64)
+    is_known = (patient >= 0) & (cancer_type >= 0)
+    pairs = np.unique(cancer_type[is_known] * len(store["ids"]["patients"]) + patient[is_known])
+    codes, counts = np.unique(pairs // len(store["ids"]["patients"]), return_counts=True)
+    return {store["ids"]["cancer_types"][code]: count for code, count in zip(codes.tolist(), counts.tolist())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Count VUEs over a combination of cohorts from a saved match store.")
+    parser.add_argument("store", help="Match store written by variant_count.py --match-store")
+    parser.add_argument("cohorts", nargs="+", help="Cohorts to combine, in merge order (e.g. mskimpact genie tcga)")
+    parser.add_argument("--gene-panels",
+                        help="Gene panel definitions (GENIE genomic_information.txt) for genePatientCount")
+    parser.add_argument("--output", help="Write {genomicLocation: counts} here instead of stdout")
+    args = parser.parse_args()
+
+    store = load_match_store(args.store)
+    panel_index = None
+    if args.gene_panels:
+        panel_index = gene_panels.build_panel_index(gene_panels.read_panel_intervals(args.gene_panels))
+    unknown = [name for name in args.cohorts if name not in store["cohorts"]]
+    if unknown:
+        parser.error(f"not in the store: {', '.join(unknown)} (available: {', '.join(store['cohorts'])})")
+    counts = count_patients(store, args.cohorts, panel_index=panel_index)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(counts, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(counts, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
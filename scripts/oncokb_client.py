@@ -0,0 +1,127 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import http_session
+import stage_trace
+
+# OncoKB annotation of VUE genomic locations (therapeutic level and oncogenicity).
+# Set ONCOKB_API_URL to point the client at a mirror or a local stub server.
+default_base_url = os.environ.get("ONCOKB_API_URL", "https://www.oncokb.org/api/v1")
+reference_genome = "GRCh37"
+
+def create_session(token, pool_size=8, retries=5, backoff_factor=1.0):
+    """Pooled session retrying GET and POST on rate limits and 5xx, with the OncoKB token and the trace hook."""
+    session = http_session.create_session(pool_size, retries, backoff_factor, allowed_methods=["GET", "POST"])
+    session.headers["Authorization"] = f"Bearer {token}"
+    session.hooks["response"].append(stage_trace.record_response)
+    return session
+
+def parse_annotation(annotation):
+    return annotation.get('highestSensitiveLevel', None), annotation.get('oncogenic', None)
+
+def annotate_one(session, base_url, genomic_location, timeout):
+    response = session.get(
+        f"{base_url}/annotate/mutations/byGenomicChange",
+        params={"genomicLocation": genomic_location, "referenceGenome": reference_genome},
+        timeout=timeout
+    )
+    if response.status_code == 200:
+        return parse_annotation(response.json())
+    return None
+
+# Batch endpoint responses meaning the server does not support it, so each location is sent on its own
+unsupported_batch_statuses = [404, 405]
+
+def annotate_batch(session, base_url, genomic_locations, timeout):
+    """Annotate a batch with one POST. Returns {location: annotation} for the annotated locations.
+
+    Falls back to one GET per location only if the server does not support the batch endpoint. On
+    a rate limit or server error that outlasts the session retries, the batch is left unannotated.
+    """
+    response = session.post(
+        f"{base_url}/annotate/mutations/byGenomicChange",
+        json=[{"genomicLocation": location, "referenceGenome": reference_genome} for location in genomic_locations],
+        timeout=timeout
+    )
+    if response.status_code in unsupported_batch_statuses:
+        return {location: annotate_one(session, base_url, location, timeout) for location in genomic_locations}
+    if response.status_code != 200:
+        print(f"OncoKB batch of {len(genomic_locations)} failed with status {response.status_code}", file=sys.stderr)
+        return {}
+    annotations = response.json()
+    if len(annotations) != len(genomic_locations):
+        print(f"OncoKB returned {len(annotations)} annotations for a batch of {len(genomic_locations)}", file=sys.stderr)
+        return {}
+    return {location: parse_annotation(annotation) for location, annotation in zip(genomic_locations, annotations)}
+
+def annotate_batch_or_skip(session, base_url, genomic_locations, timeout):
+    """annotate_batch, with a timeout or connection error leaving only this batch unannotated."""
+    try:
+        return annotate_batch(session, base_url, genomic_locations, timeout)
+    except (requests.RequestException, ValueError) as e:
+        print(f"OncoKB batch of {len(genomic_locations)} failed: {e}", file=sys.stderr)
+        return {}
+
+def cache_source(base_url):
+    """Cache section of a server and reference genome, so a staging or stub server never answers for another."""
+    return f"{base_url.rstrip('/')} {reference_genome}"
+
+def load_response_cache(path):
+    """Every cached annotation, as {source: {location: entry}}. Caches written without sources are ignored."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("sources", {})
+
+def save_response_cache(path, sources):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"sources": sources}, f)
+    os.replace(tmp_path, path)
+
+def annotate_genomic_locations(genomic_locations,
+                               base_url=default_base_url,
+                               token=None,
+                               batch_size=100,
+                               workers=4,
+                               timeout=30,
+                               cache_path=None,
+                               cache_ttl=7 * 24 * 3600):
+    """Therapeutic level and oncogenicity for each genomic location, as {location: (level, oncogenic)}.
+
+    Unique locations not in the response cache are sent in batches of batch_size, with at most
+    workers requests in flight on a pooled session. Failed lookups are (None, None) and are not cached.
+    Cached annotations are reused for cache_ttl seconds, and only for the same base_url.
+    """
+    if token is None:
+        token = os.environ.get('ONCOKB_TOKEN')
+    sources = load_response_cache(cache_path)
+    now = time.time()
+    cache = {
+        location: entry for location, entry in sources.get(cache_source(base_url), {}).items()
+        if now - entry["fetched_at"] < cache_ttl
+    }
+    missing = [location for location in dict.fromkeys(genomic_locations) if location not in cache]
+
+    if missing:
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        try:
+            with create_session(token, pool_size=workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(lambda batch: annotate_batch_or_skip(session, base_url, batch, timeout), batches)
+                fetched_at = time.time()
+                for batch_result in results:
+                    for location, annotation in batch_result.items():
+                        if annotation is not None:
+                            cache[location] = {"fetched_at": fetched_at, "annotation": list(annotation)}
+        finally:
+            # Annotations from the batches that succeeded are kept even if the run is interrupted
+            if cache_path:
+                save_response_cache(cache_path, {**sources, cache_source(base_url): cache})
+
+    return {
+        location: tuple(cache[location]["annotation"]) if location in cache else (None, None)
+        for location in genomic_locations
+    }
@@ -0,0 +1,236 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import cohort_cache
+
+# Runs the data flow as stages with declared inputs and outputs:
+#
+#   download_tcga   TCGA Pan-Cancer files from datahub            -> ./files/tcga
+#   build_json      ../VUEs.txt                                   -> ./files/pipeline/VUEs.json
+#   count           ./files/pipeline/VUEs.json + cohort files     -> ../generated/VUEs.json
+#
+# A stage is skipped when its inputs, its scripts (and the local modules they import), its
+# arguments and its outputs all have the same sha256 as after its last successful run. File hashes
+# are cached by size and mtime in the state file, so unchanged cohort files are not read again.
+# Stages that do not depend on each other run in parallel; each script writes its outputs to a
+# temporary file and renames it, so a failed stage leaves the previous outputs in place.
+#
+# download_tcga reads from the network, so it only runs when named; it skips unchanged files
+# itself. count keeps per-cohort results in a state file and counts the cohorts in --workers
+# processes, so only cohorts whose files changed are read again.
+#
+#   python pipeline.py                      build_json and count, if their inputs changed
+#   python pipeline.py download_tcga count
+#   python pipeline.py --dry-run
+
+pipeline_dir = './files/pipeline'
+state_path = os.path.join(pipeline_dir, 'pipeline_state.json')
+state_version = 1
+
+stages = {
+    "download_tcga": {
+        "script": "download_files.py",
+        "args": lambda options: ["--target", "./files/tcga"],
+        "inputs": [],
+        "outputs": ["./files/tcga"],
+        "network": True
+    },
+    "build_json": {
+        "script": "tsv_to_json.py",
+        "args": lambda options: ["--input", "../VUEs.txt", "--output", os.path.join(pipeline_dir, "VUEs.json")],
+        "inputs": ["../VUEs.txt"],
+        "outputs": [os.path.join(pipeline_dir, "VUEs.json"), os.path.join(pipeline_dir, "VUEs.idx")]
+    },
+    "count": {
+        "script": "variant_count.py",
+        "args": lambda options: [
+            "--input", os.path.join(pipeline_dir, "VUEs.json"), "--output", "../generated/VUEs.json",
+            "--state", os.path.join(pipeline_dir, "count_state.json")
+        ],
+        # Arguments that do not change the outputs, so they are not part of the stage key
+        "run_args": lambda options: ["--workers", str(options["workers"])],
+        "inputs": [
+            os.path.join(pipeline_dir, "VUEs.json"), "./files/mskimpact", "./files/mskimpact_nonsignedout",
+            "./files/genie", "./files/tcga"
+        ],
+        "outputs": ["../generated/VUEs.json", "../generated/VUEs.idx"]
+    }
+}
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {"version": state_version, "files": {}, "stages": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("version") != state_version:
+        return {"version": state_version, "files": {}, "stages": {}}
+    return state
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def path_hash(path, file_cache):
+    """Hash of a file, or of every file under a directory (skipping hidden entries), or None if missing."""
+    if os.path.isfile(path):
+        return cohort_cache.file_digest(path, file_cache)
+    if not os.path.isdir(path):
+        return None
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(f for f in files if not f.startswith('.') and not f.endswith('.tmp')):
+            file_path = os.path.join(root, name)
+            digest.update(f"{os.path.relpath(file_path, path)}\0{cohort_cache.file_digest(file_path, file_cache)}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def local_modules(script, scripts_dir='.'):
+    """The script and the modules next to it that it imports, directly or through each other."""
+    found = []
+    pending = [script]
+    while pending:
+        name = pending.pop()
+        if name in found:
+            continue
+        found.append(name)
+        with open(os.path.join(scripts_dir, name), "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                modules = [node.module]
+            else:
+                continue
+            pending.extend(
+                f"{module}.py" for module in modules if os.path.exists(os.path.join(scripts_dir, f"{module}.py"))
+            )
+    return sorted(found)
+
+def stage_key(stage, args, file_cache):
+    """sha256 over the stage's arguments, code and inputs."""
+    return hashlib.sha256(json.dumps({
+        "args": args,
+        "code": {module: cohort_cache.file_digest(module, file_cache) for module in local_modules(stage["script"])},
+        "inputs": {path: path_hash(path, file_cache) for path in stage["inputs"]}
+    }, sort_keys=True).encode('utf-8')).hexdigest()
+
+def output_hashes(stage, file_cache):
+    return {path: path_hash(path, file_cache) for path in stage["outputs"]}
+
+def is_up_to_date(name, key, state, file_cache):
+    previous = state["stages"].get(name)
+    if previous is None or previous["key"] != key:
+        return False
+    current = output_hashes(stages[name], file_cache)
+    return None not in current.values() and current == previous["outputs"]
+
+def dependencies(selected):
+    """Selected stages whose outputs are (or contain) an input of each selected stage."""
+    def contains(output, path):
+        output, path = os.path.normpath(output), os.path.normpath(path)
+        return path == output or path.startswith(output + os.sep)
+
+    return {
+        name: [
+            other for other in selected if other != name and any(
+                contains(output, path) for output in stages[other]["outputs"] for path in stages[name]["inputs"]
+            )
+        ]
+        for name in selected
+    }
+
+def run_stage(name, args):
+    for output in stages[name]["outputs"]:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, stages[name]["script"]] + args)
+    return result.returncode, time.perf_counter() - start
+
+def run_pipeline(selected, options, state, force=False, dry_run=False, jobs=2):
+    """Run the selected stages in dependency order. Returns the names of the stages that failed."""
+    depends_on = dependencies(selected)
+    pending = list(selected)
+    done, failed = set(), []
+    # Stages a dry run would run: their outputs would change, so stages that depend on them would run too
+    dirty = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for name in list(pending):
+                if any(dep in failed for dep in depends_on[name]):
+                    print(f"{name}: not run, {', '.join(dep for dep in depends_on[name] if dep in failed)} failed")
+                    pending.remove(name)
+                    failed.append(name)
+                    continue
+                if not all(dep in done for dep in depends_on[name]):
+                    continue
+                pending.remove(name)
+                # Inputs are hashed once the stages producing them have finished
+                args = stages[name]["args"](options)
+                key = stage_key(stages[name], args, state["files"])
+                upstream_dirty = any(dep in dirty for dep in depends_on[name])
+                if not force and not upstream_dirty and not stages[name].get("network") \
+                        and is_up_to_date(name, key, state, state["files"]):
+                    print(f"{name}: up to date")
+                    done.add(name)
+                elif dry_run:
+                    print(f"{name}: would run {stages[name]['script']} {' '.join(args)}")
+                    dirty.add(name)
+                    done.add(name)
+                else:
+                    args = args + stages[name].get("run_args", lambda options: [])(options)
+                    print(f"{name}: running {stages[name]['script']} {' '.join(args)}")
+                    running[executor.submit(run_stage, name, args)] = (name, key)
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, key = running.pop(future)
+                returncode, seconds = future.result()
+                if returncode != 0:
+                    print(f"{name}: failed with exit code {returncode} after {seconds:.1f}s")
+                    state["stages"].pop(name, None)
+                    failed.append(name)
+                else:
+                    print(f"{name}: done in {seconds:.1f}s")
+                    state["stages"][name] = {"key": key, "outputs": output_hashes(stages[name], state["files"])}
+                    done.add(name)
+                if not dry_run:
+                    save_state(state_path, state)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the reVUE data stages whose inputs changed.")
+    parser.add_argument("stages", nargs="*",
+                        help=f"Stages to consider, in any order: {', '.join(stages)} "
+                             "(default: every stage except download_tcga)")
+    parser.add_argument("--force", action="store_true", help="Run the stages even if their inputs are unchanged")
+    parser.add_argument("--dry-run", action="store_true", help="Only print which stages would run")
+    parser.add_argument("--jobs", type=int, default=2, help="Number of stages to run at once (default: 2)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of cohorts the count stage reads in parallel processes (default: 1)")
+    args = parser.parse_args()
+    unknown = [name for name in args.stages if name not in stages]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (available: {', '.join(stages)})")
+
+    selected = args.stages or [name for name, stage in stages.items() if not stage.get("network")]
+    selected = [name for name in stages if name in selected]
+    state = load_state(state_path)
+    failed = run_pipeline(selected, {"workers": args.workers}, state, args.force, args.dry_run, args.jobs)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
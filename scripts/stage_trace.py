@@ -0,0 +1,167 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Optional stage instrumentation for variant_count.py (--trace). Each stage records wall time,
+# thread CPU time, the process peak RSS and any counters the stage sets (rows, matched_rows, ...).
+# HTTP responses of the pooled OncoKB session are recorded with their latency. Events are written
+# in the Chrome trace-event format, so the file opens in chrome://tracing or https://ui.perfetto.dev.
+# While tracing is disabled, stage() only creates an empty dict.
+#
+#   with stage_trace.stage("read_mutations", cohort="genie") as counters:
+#       ...
+#       counters["rows"] = len(df)
+
+trace = {"enabled": False, "origin": 0.0, "events": []}
+events_lock = threading.Lock()
+
+def enable(origin=None):
+    """Start recording. Worker processes pass the parent's origin so all timestamps share one clock."""
+    trace["enabled"] = True
+    trace["origin"] = time.time() if origin is None else origin
+
+def is_enabled():
+    return trace["enabled"]
+
+def origin():
+    return trace["origin"] if trace["enabled"] else None
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def add_event(name, category, start, duration, args):
+    event = {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": round((start - trace["origin"]) * 1e6),
+        "dur": round(duration * 1e6),
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": args
+    }
+    with events_lock:
+        trace["events"].append(event)
+
+@contextmanager
+def stage(name, **args):
+    """Record the with block as a stage. Counters set on the yielded dict are stored with the event."""
+    counters = {}
+    if not trace["enabled"]:
+        yield counters
+        return
+    start, cpu_start = time.time(), time.thread_time()
+    try:
+        yield counters
+    finally:
+        add_event(name, "stage", start, time.time() - start, {
+            **args,
+            **counters,
+            "cpu_seconds": round(time.thread_time() - cpu_start, 6),
+            "max_rss_mb": round(max_rss_mb(), 1)
+        })
+
+def record_response(response, *args, **kwargs):
+    """requests response hook recording one HTTP call and its latency."""
+    if not trace["enabled"]:
+        return
+    elapsed = response.elapsed.total_seconds()
+    add_event(f"{response.request.method} {urlsplit(response.url).path}", "http", time.time() - elapsed, elapsed, {
+        "status": response.status_code,
+        "bytes": len(response.content)
+    })
+
+def take_events():
+    """Remove and return the recorded events, e.g. to send them back from a worker process."""
+    with events_lock:
+        events, trace["events"] = trace["events"], []
+    return events
+
+def add_events(events):
+    with events_lock:
+        trace["events"].extend(events)
+
+@contextmanager
+def collect_events():
+    """Collect the events recorded in the with block apart from earlier ones, into the yielded list."""
+    earlier = take_events()
+    collected = []
+    try:
+        yield collected
+    finally:
+        collected.extend(take_events())
+        add_events(earlier)
+
+def traced_chunks(name, chunks, **args):
+    """Yield from chunks, recording the time to produce each one as a stage with its row count."""
+    iterator = iter(chunks)
+    while True:
+        with stage(name, **args) as counters:
+            chunk = next(iterator, None)
+            if chunk is not None:
+                counters["rows"] = len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+def write_trace(path):
+    events = sorted(trace["events"], key=lambda event: event["ts"])
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+def event_cohort(event):
+    # File-level stages are labeled by the cohort folder their file is in (files/<cohort>/...)
+    if "cohort" in event["args"]:
+        return event["args"]["cohort"]
+    return os.path.basename(os.path.dirname(event["args"].get("file", "")))
+
+def summarize_stages(events):
+    """Totals per (stage, cohort) in order of first appearance."""
+    totals = {}
+    for event in sorted(events, key=lambda event: event["ts"]):
+        if event["cat"] != "stage":
+            continue
+        total = totals.setdefault((event["name"], event_cohort(event)), {
+            "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": 0, "matched_rows": 0, "max_rss_mb": 0.0
+        })
+        total["calls"] += 1
+        total["wall_seconds"] += event["dur"] / 1e6
+        total["cpu_seconds"] += event["args"]["cpu_seconds"]
+        total["rows"] += event["args"].get("rows", 0)
+        total["matched_rows"] += event["args"].get("matched_rows", 0)
+        total["max_rss_mb"] = max(total["max_rss_mb"], event["args"]["max_rss_mb"])
+    return totals
+
+def summarize_http(events):
+    totals = {}
+    for event in events:
+        if event["cat"] != "http":
+            continue
+        total = totals.setdefault(event["name"], {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "statuses": {}})
+        total["calls"] += 1
+        total["seconds"] += event["dur"] / 1e6
+        total["max_seconds"] = max(total["max_seconds"], event["dur"] / 1e6)
+        status = str(event["args"]["status"])
+        total["statuses"][status] = total["statuses"].get(status, 0) + 1
+    return totals
+
+def format_summary():
+    """One screen of per-stage and HTTP totals."""
+    lines = [f"{'stage':<22}{'cohort':<24}{'calls':>6}{'wall s':>9}{'cpu s':>9}{'rows':>11}{'matched':>9}{'rss MB':>9}"]
+    for (name, cohort), total in summarize_stages(trace["events"]).items():
+        lines.append(
+            f"{name:<22}{cohort:<24}{total['calls']:>6}{total['wall_seconds']:>9.2f}{total['cpu_seconds']:>9.2f}"
+            f"{total['rows'] or '':>11}{total['matched_rows'] or '':>9}{total['max_rss_mb']:>9.0f}"
+        )
+    for name, total in summarize_http(trace["events"]).items():
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(total["statuses"].items()))
+        lines.append(
+            f"HTTP {name}: {total['calls']} calls, {total['seconds']:.2f}s total, "
+            f"{total['seconds'] / total['calls'] * 1000:.0f}ms mean, {total['max_seconds'] * 1000:.0f}ms max ({statuses})"
+        )
+    return "\n".join(lines)
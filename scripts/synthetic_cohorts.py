@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Writes synthetic MAF and clinical sample files in the layout variant_count.py reads
+# (files/mskimpact, files/mskimpact_nonsignedout, files/genie and files/tcga/<study>_...),
+# so the count pipeline can be run and benchmarked without the private cohort files.
+
+cancer_types = [
+    "Non-Small Cell Lung Cancer", "Breast Cancer", "Colorectal Cancer", "Prostate Cancer", "Pancreatic Cancer",
+    "Glioma", "Melanoma", "Ovarian Cancer", "Gastrointestinal Stromal Tumor", "Leukemia", "Bladder Cancer"
+]
+impact_panels = ["IMPACT341", "IMPACT410", "IMPACT468", "IMPACT505", "ACCESS129"]
+genie_panels = ["DFCI-ONCOPANEL-3", "UCSF-NIMV4-TN", "VICC-01-T7", "MDA-50-V1"]
+tcga_studies = [
+    "acc", "blca", "brca", "cesc", "chol", "coadread", "dlbc", "esca", "gbm", "hnsc", "kich", "kirc", "kirp",
+    "laml", "lgg", "lihc", "luad", "lusc", "meso", "ov", "paad", "pcpg", "prad", "sarc", "skcm", "stad", "tgct",
+    "thca", "thym", "ucec", "ucs", "uvm"
+]
+chromosomes = [str(i) for i in range(1, 23)] + ["X", "Y"]
+bases = np.array(list("ACGT"))
+
+# Extra MAF columns that variant_count.py never reads, so column pruning is exercised
+filler_columns = [
+    "Entrez_Gene_Id", "Center", "NCBI_Build", "Strand", "Variant_Classification", "Variant_Type",
+    "Tumor_Seq_Allele1", "Matched_Norm_Sample_Barcode", "HGVSc", "HGVSp", "HGVSp_Short", "Transcript_ID",
+    "t_ref_count", "t_alt_count", "n_ref_count", "n_alt_count", "FILTER", "Consequence", "IMPACT", "SIFT"
+]
+
+def load_vue_keys(path):
+    """genomicLocation of every VUE. Null or malformed keys are left out, as variant_count.py never matches them."""
+    with open(path, 'r', encoding='utf-8') as f:
+        vues = json.load(f)
+    keys = [vue.get('genomicLocation') for gene in vues for vue in gene.get('revisedProteinEffects', [])]
+    return [key for key in keys if isinstance(key, str) and key.count(',') == 4]
+
+def sample_ids(rng, n_samples, prefix):
+    """Sample and patient ids, with one or two samples per patient."""
+    patient_numbers = np.cumsum(rng.random(n_samples) < 0.8)
+    sample_numbers = pd.Series(patient_numbers).groupby(patient_numbers).cumcount().to_numpy() + 1
+    patients = np.char.add(prefix, np.char.zfill(patient_numbers.astype(str), 7))
+    samples = np.char.add(np.char.add(patients, "-T0"), sample_numbers.astype(str))
+    return samples, patients
+
+def write_clinical(path, rng, samples, patients, panel_column, panels):
+    df = pd.DataFrame({
+        "SAMPLE_ID": samples,
+        "PATIENT_ID": patients,
+        "CANCER_TYPE": rng.choice(cancer_types, len(samples)),
+        "SAMPLE_TYPE": rng.choice(["Primary", "Metastasis"], len(samples)),
+        "ONCOTREE_CODE": "NA"
+    })
+    if panel_column:
+        df[panel_column] = rng.choice(panels, len(samples))
+    df.to_csv(path, sep="\t", index=False)
+
+def write_mutations(path, rng, samples, vue_keys, mutations_per_sample, vue_hit_rate,
+                    germline_fraction, unknown_fraction, block_size=200000):
+    """Write a MAF for samples in blocks, with Poisson mutations per sample and VUE hits at vue_hit_rate."""
+    vue_parts = np.array([key.split(',') for key in vue_keys], dtype=object)
+    header = True
+    for block_start in range(0, len(samples), block_size):
+        block = samples[block_start:block_start + block_size]
+        n_rows = rng.poisson(mutations_per_sample, len(block))
+        barcodes = np.repeat(block, n_rows)
+        n = len(barcodes)
+
+        is_vue = rng.random(n) < vue_hit_rate
+        chromosome = rng.choice(chromosomes, n).astype(object)
+        start = rng.integers(1, 150000000, n)
+        ref = bases[rng.integers(0, 4, n)].astype(object)
+        alt = bases[rng.integers(0, 4, n)].astype(object)
+        # About one in ten background mutations is a deletion
+        is_deletion = rng.random(n) < 0.1
+        alt[is_deletion] = '-'
+        end = start.astype(object)
+        start = start.astype(object)
+        picked = vue_parts[rng.integers(0, len(vue_parts), is_vue.sum())]
+        chromosome[is_vue], start[is_vue], end[is_vue], ref[is_vue], alt[is_vue] = picked.T
+
+        status = rng.random(n)
+        mutation_status = np.where(
+            status < germline_fraction, "GERMLINE",
+            np.where(status < germline_fraction + unknown_fraction, "UNKNOWN", "SOMATIC")
+        )
+
+        df = pd.DataFrame({
+            "Hugo_Symbol": "GENE",
+            "Chromosome": chromosome,
+            "Start_Position": start,
+            "End_Position": end,
+            "Reference_Allele": ref,
+            "Tumor_Seq_Allele2": alt,
+            "Tumor_Sample_Barcode": barcodes,
+            "Mutation_Status": mutation_status
+        })
+        for col in filler_columns:
+            df[col] = "."
+        df.to_csv(path, sep="\t", index=False, header=header, mode='w' if header else 'a')
+        header = False
+
+def write_panel_definitions(path, rng, vue_keys, panel_coverage):
+    """A GENIE-style genomic_information.txt where each panel covers a random panel_coverage share of the VUEs."""
+    positions = []
+    for key in vue_keys:
+        chromosome, start, end = key.split(',')[:3]
+        # Keys without numeric positions are covered by no panel
+        if start.isdigit() and end.isdigit():
+            positions.append((chromosome, int(start), int(end)))
+    rows = []
+    for panel in ["MSK-" + panel for panel in impact_panels] + genie_panels:
+        for chromosome, start, end in positions:
+            if rng.random() < panel_coverage:
+                rows.append((chromosome, start - 50, end + 50, panel, "TRUE"))
+        # Background intervals elsewhere in the genome
+        for chromosome, start in zip(rng.choice(chromosomes, 500), rng.integers(1, 150000000, 500)):
+            rows.append((chromosome, int(start), int(start) + 200, panel, "TRUE"))
+    pd.DataFrame(rows, columns=["Chromosome", "Start_Position", "End_Position", "SEQ_ASSAY_ID", "includeInPanel"]).to_csv(
+        path, sep="\t", index=False
+    )
+
+def generate(output_dir, vue_keys, samples=10000, mutations_per_sample=8.0, vue_hit_rate=0.001,
+             germline_fraction=0.05, unknown_fraction=0.02, genie_msk_fraction=0.3, n_tcga_studies=32, panel_coverage=0.8,
+             seed=0):
+    """Write all cohorts under output_dir/files. GENIE gets twice the samples, TCGA a fifth."""
+    rng = np.random.default_rng(seed)
+    files_dir = os.path.join(output_dir, "files")
+    mutation_options = dict(
+        vue_keys=vue_keys, mutations_per_sample=mutations_per_sample, vue_hit_rate=vue_hit_rate,
+        germline_fraction=germline_fraction, unknown_fraction=unknown_fraction
+    )
+
+    msk_samples, msk_patients = sample_ids(rng, samples, "P-")
+    os.makedirs(os.path.join(files_dir, "mskimpact"), exist_ok=True)
+    write_clinical(os.path.join(files_dir, "mskimpact", "mskimpact_data_clinical_sample.txt"),
+                   rng, msk_samples, msk_patients, "GENE_PANEL", impact_panels)
+    write_mutations(os.path.join(files_dir, "mskimpact", "mskimpact_data_mutations_extended.txt"),
+                    rng, msk_samples, **mutation_options)
+
+    nonsignedout_samples, nonsignedout_patients = sample_ids(rng, max(1, samples // 10), "P-9")
+    os.makedirs(os.path.join(files_dir, "mskimpact_nonsignedout"), exist_ok=True)
+    write_clinical(os.path.join(files_dir, "mskimpact_nonsignedout", "data_clinical_sample.txt"),
+                   rng, nonsignedout_samples, nonsignedout_patients, "GENE_PANEL", impact_panels)
+    write_mutations(os.path.join(files_dir, "mskimpact_nonsignedout", "data_nonsignedout_mutations.txt"),
+                    rng, nonsignedout_samples, **mutation_options)
+
+    # GENIE re-releases part of MSK-IMPACT under GENIE-MSK- ids, plus samples from other centers
+    n_msk = int(samples * genie_msk_fraction)
+    other_samples, other_patients = sample_ids(rng, 2 * samples - n_msk, "GENIE-DFCI-")
+    genie_samples = np.concatenate([np.char.add("GENIE-MSK-", msk_samples[:n_msk]), other_samples])
+    genie_patients = np.concatenate([np.char.add("GENIE-MSK-", msk_patients[:n_msk]), other_patients])
+    os.makedirs(os.path.join(files_dir, "genie"), exist_ok=True)
+    write_clinical(os.path.join(files_dir, "genie", "genie_data_clinical_sample.txt"),
+                   rng, genie_samples, genie_patients, "SEQ_ASSAY_ID",
+                   ["MSK-" + panel for panel in impact_panels[:4]] + genie_panels)
+    write_mutations(os.path.join(files_dir, "genie", "genie_data_mutations_extended.txt"),
+                    rng, genie_samples, **mutation_options)
+    write_panel_definitions(os.path.join(files_dir, "genie", "genomic_information.txt"), rng, vue_keys, panel_coverage)
+
+    os.makedirs(os.path.join(files_dir, "tcga"), exist_ok=True)
+    studies = tcga_studies[:n_tcga_studies]
+    for study in studies:
+        study_samples, study_patients = sample_ids(rng, max(1, samples // 5 // len(studies)), f"TCGA-{study.upper()}-")
+        prefix = os.path.join(files_dir, "tcga", f"{study}_tcga_pan_can_atlas_2018")
+        write_clinical(f"{prefix}_clinical_samples.txt", rng, study_samples, study_patients, None, None)
+        write_mutations(f"{prefix}_mutations.txt", rng, study_samples, **mutation_options)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic cohort files for variant_count.py.")
+    parser.add_argument("output_dir", help="Directory to create files/ in (run variant_count.py from here)")
+    parser.add_argument("--vues", default='../generated/VUEs.json', help="VUEs.json to draw VUE hits from")
+    parser.add_argument("--samples", type=int, default=10000, help="MSK-IMPACT sample count (default: 10000)")
+    parser.add_argument("--mutations-per-sample", type=float, default=8.0, help="Mean mutations per sample")
+    parser.add_argument("--vue-hit-rate", type=float, default=0.001, help="Fraction of mutations that are a VUE")
+    parser.add_argument("--germline-fraction", type=float, default=0.05)
+    parser.add_argument("--unknown-fraction", type=float, default=0.02)
+    parser.add_argument("--genie-msk-fraction", type=float, default=0.3,
+                        help="Fraction of MSK-IMPACT samples also in GENIE as GENIE-MSK-")
+    parser.add_argument("--tcga-studies", type=int, default=32)
+    parser.add_argument("--panel-coverage", type=float, default=0.8,
+                        help="Share of the VUEs each gene panel covers in genomic_information.txt")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(
+        args.output_dir, load_vue_keys(args.vues), samples=args.samples,
+        mutations_per_sample=args.mutations_per_sample, vue_hit_rate=args.vue_hit_rate,
+        germline_fraction=args.germline_fraction, unknown_fraction=args.unknown_fraction,
+        genie_msk_fraction=args.genie_msk_fraction, n_tcga_studies=args.tcga_studies,
+        panel_coverage=args.panel_coverage, seed=args.seed
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+import count_cube
+
+def make_cube():
+    rows = [
+        ("KIT", "4,55593464,55593464,A,C", "total", "somatic", "", 5),
+        ("KIT", "4,55593464,55593464,A,C", "total", "somatic", "Melanoma", 3),
+        ("KIT", "4,55593464,55593464,A,C", "total", "somatic", "Gastrointestinal Stromal Tumor", 2),
+        ("EGFR", "7,55242466,55242466,G,T", "total", "germline", "", 4),
+        ("EGFR", "7,55242466,55242466,G,T", "total", "germline", "Melanoma", 1),
+        ("EGFR", "7,55242466,55242466,G,T", "total", "germline", "Non-Small Cell Lung Cancer", 3),
+    ]
+    counts = pd.DataFrame(rows, columns=count_cube.dimensions + ['patients'])
+    patients = {"total": {"": 1000, "Melanoma": 100, "Gastrointestinal Stromal Tumor": 50, "Non-Small Cell Lung Cancer": 400}}
+    return {"counts": counts, "patients": patients, "gene_patients": {}}
+
+def test_percentage_over_the_whole_cohort():
+    result = count_cube.percentage(make_cube(), "total")
+    assert result["KIT"] == pytest.approx(0.5)
+    assert result["EGFR"] == pytest.approx(0.4)
+
+def test_percentage_of_selected_cancer_types_uses_their_patients():
+    cube = make_cube()
+    result = count_cube.percentage(cube, "total", cancer_types=["Melanoma", "Gastrointestinal Stromal Tumor"])
+    assert result["KIT"] == pytest.approx(5 * 100.0 / 150)
+    assert result["EGFR"] == pytest.approx(1 * 100.0 / 150)
+
+    result = count_cube.percentage(cube, "total", by=["gene", "cancer_type"], cancer_types=["Melanoma"])
+    assert result[("KIT", "Melanoma")] == pytest.approx(3.0)
@@ -0,0 +1,61 @@
+import os
+import pipeline
+
+# build_json -> count with stand-in scripts, so the test does not need the cohort files
+
+copy_script = '''import shutil, sys
+shutil.copyfile(sys.argv[1], sys.argv[2])
+'''
+
+def make_stages(tmp_path):
+    (tmp_path / "copy_file.py").write_text(copy_script)
+    return {
+        "build_json": {
+            "script": "copy_file.py",
+            "args": lambda options: ["VUEs.txt", "VUEs.json"],
+            "inputs": ["VUEs.txt"],
+            "outputs": ["VUEs.json"]
+        },
+        "count": {
+            "script": "copy_file.py",
+            "args": lambda options: ["VUEs.json", "counts.json"],
+            "inputs": ["VUEs.json"],
+            "outputs": ["counts.json"]
+        }
+    }
+
+def test_dry_run_cascades_to_dependent_stages(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline, "stages", make_stages(tmp_path))
+    monkeypatch.setattr(pipeline, "state_path", str(tmp_path / "pipeline_state.json"))
+    (tmp_path / "VUEs.txt").write_text("KIT\n")
+
+    state = pipeline.load_state(pipeline.state_path)
+    assert pipeline.run_pipeline(["build_json", "count"], {}, state) == []
+    capsys.readouterr()
+
+    # Only the upstream input changes; count's own input is stale until build_json runs
+    (tmp_path / "VUEs.txt").write_text("KIT\nEGFR\n")
+    state = pipeline.load_state(pipeline.state_path)
+    assert pipeline.run_pipeline(["build_json", "count"], {}, state, dry_run=True) == []
+    output = capsys.readouterr().out
+    assert "build_json: would run" in output
+    assert "count: would run" in output
+    assert (tmp_path / "counts.json").read_text() == "KIT\n"
+
+def test_dry_run_reports_unchanged_stages_up_to_date(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline, "stages", make_stages(tmp_path))
+    monkeypatch.setattr(pipeline, "state_path", str(tmp_path / "pipeline_state.json"))
+    (tmp_path / "VUEs.txt").write_text("KIT\n")
+
+    state = pipeline.load_state(pipeline.state_path)
+    assert pipeline.run_pipeline(["build_json", "count"], {}, state) == []
+    capsys.readouterr()
+
+    state = pipeline.load_state(pipeline.state_path)
+    assert pipeline.run_pipeline(["build_json", "count"], {}, state, dry_run=True) == []
+    output = capsys.readouterr().out
+    assert "build_json: up to date" in output
+    assert "count: up to date" in output
+    assert os.path.exists(tmp_path / "counts.json")
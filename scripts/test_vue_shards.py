@@ -0,0 +1,17 @@
+import os
+import vue_shards
+
+def record(gene):
+    return {"hugoGeneSymbol": gene, "revisedProteinEffects": [{"variant": f"{gene} variant"}]}
+
+def test_colliding_gene_names_get_separate_shards(tmp_path):
+    genes = ["KIT", "A/B", "A_B", "ABC", "abc", "manifest"]
+    vue_shards.write_shards([record(gene) for gene in genes], str(tmp_path))
+
+    manifest = vue_shards.load_manifest(str(tmp_path))
+    paths = [manifest["genes"][gene]["path"] for gene in genes]
+    assert len({path.lower() for path in paths + [vue_shards.manifest_name]}) == len(genes) + 1
+    assert manifest["genes"]["KIT"]["path"] == "KIT.json"
+    for gene in genes:
+        assert vue_shards.load_gene(str(tmp_path), gene) == record(gene)
+    assert sorted(os.listdir(tmp_path)) == sorted(paths + [vue_shards.manifest_name])
@@ -1,79 +1,129 @@
-import pandas as pd
+import argparse
 import json
+import os
+import pandas as pd
+import vue_lookup
+import vue_shards
+
+# orjson is an optional, faster serializer (pip install orjson). Its output is indented by 2
+# spaces, so it is only used with --fast-json; the default output is byte-identical to json.dump.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Read the file as a dataframe
-df = pd.read_csv('../VUEs.txt', delimiter='\t', encoding='utf-8')
+gene_columns = ['transcriptId', 'genomicLocationDescription', 'defaultEffect', 'comment', 'context']
+variant_columns = [
+    'variant', 'genomicLocation', 'transcriptId', 'vepPredictedProteinEffect', 'vepPredictedVariantClassification',
+    'revisedProteinEffect', 'revisedVariantClassification', 'revisedStandardVariantClassification', 'hgvsc'
+]
+optional_variant_columns = ['mutationOrigin', 'variantNote', 'otherVariation']
 
-# Replace NaN with None so JSON shows null
-df = df.where(pd.notnull(df), None)
+def read_vues_table(path):
+    """Read VUEs.txt as column lists of Python values, with None for empty cells so JSON shows null."""
+    df = pd.read_csv(path, delimiter='\t', encoding='utf-8')
+    df = df.astype(object).where(df.notna(), None)
+    columns = {col: df[col].tolist() for col in df.columns}
 
-# Set columns to string type for splitting (only if not None)
-df['pubmedId'] = df['pubmedId'].astype(str)
-df['referenceText'] = df['referenceText'].astype(str)
+    # References are split as text; a missing value renders as 'None'
+    for col in ['pubmedId', 'referenceText']:
+        columns[col] = [str(value) for value in columns[col]]
+    return columns
 
-# Group data by hugoGeneSymbol while preserving the order
-grouped_data = df.groupby('hugoGeneSymbol', sort=False)
+def build_references(pubmed_id, reference_text):
+    # pubmedId and referenceText are ';' separated lists, paired by position
+    pubmed_ids = pubmed_id.split(';') if pubmed_id else []
+    reference_texts = reference_text.split(';') if reference_text else []
+    return [
+        {"pubmedId": pubmed_ids[i], "referenceText": reference_texts[i]}
+        for i in range(min(len(pubmed_ids), len(reference_texts)))
+    ]
 
-# Initialize the final JSON array
-json_array = []
+def build_gene_records(columns):
+    """Yield per-gene records in order of first appearance, in one pass over the column lists.
 
-# Iterate over each group
-for name, group in grouped_data:
-    # Initialize the dictionary for each group
-    group_dict = {
-        "hugoGeneSymbol": name,
-        "transcriptId": group['transcriptId'].iloc[0],
-        "genomicLocationDescription": group['genomicLocationDescription'].iloc[0],
-        "defaultEffect": group['defaultEffect'].iloc[0],
-        "comment": group['comment'].iloc[0] if group['comment'].iloc[0] is not None else "",
-        "context": group['context'].iloc[0] if group['context'].iloc[0] is not None else "",
-        "revisedProteinEffects": []
-    }
+    A gene is yielded as soon as its last row has been read and every gene before it has been
+    yielded, so with VUEs.txt grouped by gene only the record being built is held in memory.
+    """
+    genes = {}
+    last_rows = {gene: row for row, gene in enumerate(columns['hugoGeneSymbol'])}
+    for row in range(len(columns['hugoGeneSymbol'])):
+        gene = columns['hugoGeneSymbol'][row]
+        if gene is None:
+            continue
+        if gene not in genes:
+            first = {col: columns[col][row] for col in gene_columns}
+            genes[gene] = {
+                "hugoGeneSymbol": gene,
+                "transcriptId": first['transcriptId'],
+                "genomicLocationDescription": first['genomicLocationDescription'],
+                "defaultEffect": first['defaultEffect'],
+                "comment": first['comment'] if first['comment'] is not None else "",
+                "context": first['context'] if first['context'] is not None else "",
+                "revisedProteinEffects": []
+            }
 
-    # Iterate over each row in the group
-    for index, row in group.iterrows():
-        # Create a dictionary for each variant
-        variant_dict = {
-            "variant": row['variant'],
-            "genomicLocation": row['genomicLocation'],
-            "transcriptId": row['transcriptId'],
-            "vepPredictedProteinEffect": row['vepPredictedProteinEffect'],
-            "vepPredictedVariantClassification": row['vepPredictedVariantClassification'],
-            "revisedProteinEffect": row['revisedProteinEffect'],
-            "revisedVariantClassification": row['revisedVariantClassification'],
-            "revisedStandardVariantClassification": row['revisedStandardVariantClassification'],
-            "hgvsc": row['hgvsc'],
-            "confirmed": bool(row['confirmed']) if row['confirmed'] is not None else False,
-            "references": []
-        }
-        if row['mutationOrigin'] is not None:
-            variant_dict['mutationOrigin'] = row['mutationOrigin']
-        if row['variantNote'] is not None:
-            variant_dict['variantNote'] = row['variantNote']
-        if row['otherVariation'] is not None:
-            variant_dict['otherVariation'] = row['otherVariation']
+        variant = {col: columns[col][row] for col in variant_columns}
+        confirmed = columns['confirmed'][row]
+        variant["confirmed"] = bool(confirmed) if confirmed is not None else False
+        variant["references"] = build_references(columns['pubmedId'][row], columns['referenceText'][row])
+        for col in optional_variant_columns:
+            if columns[col][row] is not None:
+                variant[col] = columns[col][row]
+        genes[gene]["revisedProteinEffects"].append(variant)
+        while genes and last_rows[next(iter(genes))] <= row:
+            yield genes.pop(next(iter(genes)))
 
-        # Parse pubmedId and referenceText
-        pubmed_ids = row['pubmedId'].split(';') if row['pubmedId'] else []
-        reference_texts = row['referenceText'].split(';') if row['referenceText'] else []
+def keep_records(records, kept):
+    """Yield records unchanged, also appending them to kept for the outputs written after the JSON."""
+    for record in records:
+        kept.append(record)
+        yield record
 
-        # Create pairs of pubmedId and referenceText
-        pairs = []
-        for i in range(min(len(pubmed_ids), len(reference_texts))):
-            pairs.append({
-                "pubmedId": pubmed_ids[i],
-                "referenceText": reference_texts[i]
-            })
+def serialize_record(record, fast=False):
+    if fast:
+        return orjson.dumps(record, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(record, indent=4, ensure_ascii=False)
 
-        # Add pairs to the reference list
-        variant_dict['references'] = pairs
+def write_json_array(records, path, fast=False):
+    """Stream records to path one at a time, in the same layout as json.dump(records, indent=4)."""
+    indent = '  ' if fast else '    '
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        first = True
+        for record in records:
+            f.write('[\n' if first else ',\n')
+            f.write('\n'.join(indent + line for line in serialize_record(record, fast).split('\n')))
+            first = False
+        f.write('[]' if first else '\n]')
+    os.replace(tmp_path, path)
 
-        # Add the variant dictionary to the revisedProteinEffects list
-        group_dict['revisedProteinEffects'].append(variant_dict)
+def main():
+    parser = argparse.ArgumentParser(description="Build generated/VUEs.json from VUEs.txt.")
+    parser.add_argument("--input", default='../VUEs.txt', help="VUE table (default: %(default)s)")
+    parser.add_argument("--output", default='../generated/VUEs.json', help="Output JSON (default: %(default)s)")
+    parser.add_argument("--fast-json", action="store_true",
+                        help="Serialize with orjson (2-space indent, not byte-identical to the default)")
+    parser.add_argument("--no-lookup", action="store_true",
+                        help="Do not write the binary lookup file (VUEs.idx) next to the output")
+    parser.add_argument("--shards",
+                        help="Also write one JSON file per gene and a manifest to this directory "
+                             "(e.g. ../generated/genes); only changed genes are rewritten")
+    args = parser.parse_args()
+    if args.fast_json and orjson is None:
+        parser.error("--fast-json requires orjson (pip install orjson)")
 
-    # Add the group dictionary to the final JSON array
-    json_array.append(group_dict)
+    records = build_gene_records(read_vues_table(args.input))
+    # The lookup file and the shards need every record; without them nothing is kept after it is written
+    kept = []
+    if not args.no_lookup or args.shards:
+        records = keep_records(records, kept)
+    write_json_array(records, args.output, fast=args.fast_json)
+    records = kept
+    if not args.no_lookup:
+        vue_lookup.write_lookup(records, vue_lookup.lookup_path_for(args.output))
+    if args.shards:
+        vue_shards.write_shards(records, args.shards)
 
-# Write the JSON array to a file
-with open('../generated/VUEs.json', 'w', encoding='utf-8') as f:
-    json.dump(json_array, f, indent=4, ensure_ascii=False)
+if __name__ == "__main__":
+    main()
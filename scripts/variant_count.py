@@ -1,9 +1,20 @@
+import argparse
 import json
 import os
+import sys
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Dict, Set, Any, Tuple
-import requests
 from itertools import chain
+import cohort_cache
+import count_cube
+import gene_panels
+import interval_index
+import match_store
+import oncokb_client
+import stage_trace
+import vue_lookup
+import vue_shards
 
 # Download files first
 # There will be internal MSK-IMAPCT, GENIE v15 public cohort, and TCGA Pan-Cancer Atlas (32 cohorts)
@@ -18,70 +29,164 @@ target_gene_panels_by_cohorts = {
     "mskimpact_nonsignedout": ["IMPACT341", "IMPACT410", "IMPACT468", "IMPACT505"],
     # "genie": ["MSK-IMPACT341", "MSK-IMPACT410", "MSK-IMPACT468", "MSK-IMPACT505"]
 }
-vues = pd.read_json('../generated/VUEs.json')
-
-vue_df = pd.json_normalize(
-    data=vues.to_dict(orient='records'),
-    record_path='revisedProteinEffects'
-)
-
-vue_df = vue_df.rename(columns={'genomicLocation': 'vue'})
-vue_df = vue_df.set_index('vue')[[]]
-
-# fetch therapeutic level and oncogenicity from OncoKB
-def get_therapeutic_level(genomic_location):
-    url = f"https://www.oncokb.org/api/v1/annotate/mutations/byGenomicChange?genomicLocation={genomic_location}&referenceGenome=GRCh37"
-    headers = {"Authorization": f"Bearer {os.environ.get('ONCOKB_TOKEN')}"}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json().get('highestSensitiveLevel', None), response.json().get('oncogenic', None)
-    return None, None
-
-def read_clinical_df(path, cohort_name, target_gene_panels_by_cohorts):
+vues_json_path = '../generated/VUEs.json'
+# Gene panel definitions for genePatientCount (GENIE genomic_information.txt); used if present
+gene_panels_path = './files/genie/genomic_information.txt'
+
+def load_vue_df(path):
+    """Empty DataFrame indexed by the genomicLocation of every VUE. Count columns are added per cohort."""
+    vues = pd.read_json(path)
+
+    vue_df = pd.json_normalize(
+        data=vues.to_dict(orient='records'),
+        record_path='revisedProteinEffects'
+    )
+
+    vue_df = vue_df.rename(columns={'genomicLocation': 'vue'})
+    # A VUE without a genomicLocation cannot be matched and is left out of the counts. A VUE listed
+    # twice is counted once, and both entries get the same counts.
+    vue_df = vue_df.dropna(subset=['vue']).set_index('vue')[[]]
+    return vue_df[~vue_df.index.duplicated()]
+
+# Clinical columns kept when reading a clinical file, read as text
+clinical_columns = ['SAMPLE_ID', 'PATIENT_ID', 'CANCER_TYPE', 'GENE_PANEL', 'SEQ_ASSAY_ID']
+
+def parse_clinical_df(path):
+    return pd.read_csv(path, sep="\t", usecols=lambda col: col in clinical_columns, dtype=str)
+
+def read_clinical_df(path, cohort_name, target_gene_panels_by_cohorts, cache_dir=None):
     """Read and normalize a clinical file. Filter by GENE_PANEL if gene panels are provided for this cohort."""
-    df = pd.read_csv(path, sep="\t", low_memory=False)
+    with stage_trace.stage("read_clinical", file=path) as counters:
+        if cache_dir:
+            df = cohort_cache.cached_table(cache_dir, path, "clinical", None, lambda: parse_clinical_df(path))
+        else:
+            df = parse_clinical_df(path)
+        counters["rows"] = len(df)
 
     gene_panel_column = "SEQ_ASSAY_ID" if cohort_name == "genie" else "GENE_PANEL"
     if cohort_name in target_gene_panels_by_cohorts and gene_panel_column in df.columns:
         target_panels = target_gene_panels_by_cohorts[cohort_name]
         df = df[df[gene_panel_column].isin(target_panels)]
 
-    df = df[['SAMPLE_ID', 'PATIENT_ID', 'CANCER_TYPE']].copy()
+    df = df.assign(PANEL=df[gene_panel_column] if gene_panel_column in df.columns else None)
+    df = df[['SAMPLE_ID', 'PATIENT_ID', 'CANCER_TYPE', 'PANEL']].copy()
     df[['SAMPLE_ID', 'PATIENT_ID']] = df[['SAMPLE_ID', 'PATIENT_ID']].apply(
         lambda col: col.str.replace("GENIE-MSK-", "", regex=False)
     )
     return df
 
-def read_mutation_df(path):
-    df = pd.read_csv(path, sep="\t", low_memory=False)
-    df = df[[
-        'Chromosome', 'Start_Position', 'End_Position',
-        'Reference_Allele', 'Tumor_Seq_Allele2',
-        'Tumor_Sample_Barcode', 'Mutation_Status'
-    ]].copy()
+# Only these MAF columns are used for counting; everything is read as text so the
+# genomicLocation key keeps the file's own rendering across chunks
+mutation_key_columns = ['Chromosome', 'Start_Position', 'End_Position', 'Reference_Allele', 'Tumor_Seq_Allele2']
+mutation_columns = mutation_key_columns + ['Tumor_Sample_Barcode', 'Mutation_Status']
+mutation_chunk_size = 200000
+
+def build_genomic_location(df):
+    """Build the Chromosome,Start,End,Ref,Alt key with vectorized string concatenation. Missing fields render as 'nan'."""
+    parts = [df[col].fillna('nan') for col in mutation_key_columns]
+    return parts[0].str.cat(parts[1:], sep=',')
+
+def unique_vue_keys(vue_keys):
+    """Distinct VUE keys with the five Chromosome,Start,End,Ref,Alt fields; null or malformed keys can never match."""
+    vue_index = pd.Index(vue_keys).unique()
+    return vue_index[[isinstance(key, str) and key.count(',') == 4 for key in vue_index]]
+
+def get_vue_codes(genomic_location, vue_index):
+    """Position of each genomicLocation in vue_index, -1 for mutations that are not a VUE."""
+    return vue_index.get_indexer(genomic_location)
+
+def parse_mutation_chunks(path, chunksize):
+    return pd.read_csv(
+        path, sep="\t", usecols=mutation_columns,
+        dtype={col: str for col in mutation_columns}, chunksize=chunksize
+    )
 
+def match_chunk_by_interval(chunk, index, match_mode):
+    """Rows of chunk matching a VUE through the interval index, with genomicLocation set to the VUE key."""
+    rows, keys = interval_index.match_mutations(
+        index,
+        chunk['Chromosome'].fillna('').str.replace(r'^chr', '', regex=True).to_numpy(dtype=object),
+        pd.to_numeric(chunk['Start_Position'], errors='coerce').to_numpy(dtype=float),
+        pd.to_numeric(chunk['End_Position'], errors='coerce').to_numpy(dtype=float),
+        chunk['Reference_Allele'].fillna('-').to_numpy(dtype=object),
+        chunk['Tumor_Seq_Allele2'].fillna('-').to_numpy(dtype=object),
+        match_mode
+    )
+    return chunk.iloc[rows].assign(genomicLocation=keys)
+
+def read_mutation_df(path, vue_keys=None, chunksize=mutation_chunk_size, cache_dir=None, match_mode='exact'):
+    """Read a mutation file in chunks. If vue_keys is given, rows that are not a VUE are dropped while reading.
+
+    With cache_dir, the column-pruned table is read from (or written to) the local cohort cache.
+    With a match_mode other than 'exact', genomicLocation is the key of the matched VUE, which can
+    differ from the mutation's own key (see interval_index.match_modes).
+    """
+    if vue_keys is not None:
+        vue_index = unique_vue_keys(vue_keys)
+        # Cheap single-column prefilter so keys are only built for rows that can match
+        vue_starts = set(key.split(',')[1] for key in vue_index)
+        if match_mode != 'exact':
+            vue_interval_index = interval_index.build_interval_index(vue_index)
+
+    if cache_dir:
+        reader = cohort_cache.cached_chunks(
+            cache_dir, path, "mutation", mutation_columns,
+            lambda: parse_mutation_chunks(path, chunksize), chunksize
+        )
+    else:
+        reader = parse_mutation_chunks(path, chunksize)
+    chunks = []
+    # Position of every row in the file, so matches counted in separate runs can be put back in file order
+    first_row = 0
+    for chunk in stage_trace.traced_chunks("read_mutations", reader, file=path):
+        chunk = chunk.assign(row=range(first_row, first_row + len(chunk)))
+        first_row += len(chunk)
+        if vue_keys is not None and match_mode != 'exact':
+            with stage_trace.stage("match_intervals", file=path) as counters:
+                chunks.append(match_chunk_by_interval(chunk, vue_interval_index, match_mode))
+                counters["matched_rows"] = len(chunks[-1])
+            continue
+        with stage_trace.stage("build_keys", file=path) as counters:
+            if vue_keys is not None:
+                chunk = chunk[chunk['Start_Position'].fillna('nan').isin(vue_starts)]
+            chunk = chunk.assign(genomicLocation=build_genomic_location(chunk))
+            counters["rows"] = len(chunk)
+        if vue_keys is not None:
+            with stage_trace.stage("match_keys", file=path) as counters:
+                chunk = chunk[get_vue_codes(chunk['genomicLocation'], vue_index) >= 0]
+                counters["matched_rows"] = len(chunk)
+        chunks.append(chunk)
+
+    df = pd.concat(chunks, ignore_index=True)
     df['Tumor_Sample_Barcode'] = df['Tumor_Sample_Barcode'].str.replace("GENIE-MSK-", "", regex=False)
-    df['genomicLocation'] = df[['Chromosome', 'Start_Position', 'End_Position',
-                                'Reference_Allele', 'Tumor_Seq_Allele2']].astype(str).agg(','.join, axis=1)
-
-    return df
-
-def build_variant_and_status_maps(mutation_df, vue_df):
-    matched = mutation_df[mutation_df['genomicLocation'].isin(vue_df.index)]
-    variant_to_sample = matched.groupby('genomicLocation')['Tumor_Sample_Barcode'].apply(list).to_dict()
-    sample_to_mutation_status = matched.set_index('Tumor_Sample_Barcode')['Mutation_Status'].to_dict()
-    return matched, variant_to_sample, sample_to_mutation_status
+    return df[mutation_columns + ['genomicLocation', 'row']]
+
+def build_vue_matches(mutation_df, vue_df):
+    """Mutation rows that are a VUE, as (vue, sample_id, mutation_status, row) in file order."""
+    vue_codes = get_vue_codes(mutation_df['genomicLocation'], unique_vue_keys(vue_df.index))
+    matched = mutation_df[vue_codes >= 0]
+    return pd.DataFrame({
+        'vue': matched['genomicLocation'].to_numpy(dtype=object),
+        'sample_id': matched['Tumor_Sample_Barcode'].to_numpy(dtype=object),
+        'mutation_status': matched['Mutation_Status'].to_numpy(dtype=object),
+        'row': matched['row'].to_numpy()
+    })
 
 def build_sample_to_patient_map(clinical_df, valid_sample_ids):
     filtered = clinical_df[clinical_df['SAMPLE_ID'].isin(valid_sample_ids)]
     return filtered.set_index('SAMPLE_ID')['PATIENT_ID'].to_dict()
 
 def process_cohort(clinical_df, mutation_df, vue_df):
-    matched_df, variant_to_sample, sample_to_mutation_status = build_variant_and_status_maps(mutation_df, vue_df)
-    sample_to_patient = build_sample_to_patient_map(clinical_df, matched_df['Tumor_Sample_Barcode'].unique())
+    matches = build_vue_matches(mutation_df, vue_df)
+    sample_to_patient = build_sample_to_patient_map(clinical_df, matches['sample_id'].unique())
     sample_to_cancer_type = clinical_df.set_index('SAMPLE_ID')['CANCER_TYPE'].to_dict()
 
-    return variant_to_sample, sample_to_mutation_status, sample_to_patient, sample_to_cancer_type
+    return matches, sample_to_patient, sample_to_cancer_type
+
+# The 32 PanCan Atlas studies are small files, so they are read on threads
+tcga_read_workers = 8
+# Row positions of the n-th study file start at n * tcga_file_rows, so TCGA matches sort in read order
+tcga_file_rows = 2 ** 32
 
 def find_tcga_file_pairs(folder_path):
     files = os.listdir(folder_path)
@@ -97,20 +202,24 @@ def find_tcga_file_pairs(folder_path):
             ))
     return pairs
 
-def read_all_tcga(folder_path):
+def read_tcga_pair(clinical_path, mutation_path, vue_keys=None, cache_dir=None, match_mode='exact'):
+    clinical_df = read_clinical_df(clinical_path, "tcga", target_gene_panels_by_cohorts, cache_dir=cache_dir)
+    mutation_df = read_mutation_df(mutation_path, vue_keys=vue_keys, cache_dir=cache_dir, match_mode=match_mode)
+    return clinical_df, mutation_df
+
+def read_all_tcga(folder_path, vue_keys=None, workers=tcga_read_workers, cache_dir=None, match_mode='exact'):
+    """Read every TCGA study pair concurrently. Mutations are filtered to VUE hits per file, before concatenation."""
     pairs = find_tcga_file_pairs(folder_path)
 
-    all_clinical = [
-        read_clinical_df(clinical_path, "tcga", target_gene_panels_by_cohorts)
-        for clinical_path, _ in pairs
-    ]
-    all_mutation = [
-        read_mutation_df(mutation_path)
-        for _, mutation_path in pairs
-    ]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pairs)))) as executor:
+        results = list(executor.map(
+            lambda pair: read_tcga_pair(*pair, vue_keys=vue_keys, cache_dir=cache_dir, match_mode=match_mode), pairs
+        ))
 
-    clinical_df = pd.concat(all_clinical, ignore_index=True)
-    mutation_df = pd.concat(all_mutation, ignore_index=True)
+    clinical_df = pd.concat([clinical for clinical, _ in results], ignore_index=True)
+    mutation_df = pd.concat([
+        mutation.assign(row=mutation['row'] + i * tcga_file_rows) for i, (_, mutation) in enumerate(results)
+    ], ignore_index=True)
 
     return clinical_df, mutation_df
 
@@ -118,65 +227,63 @@ def categorize_mutation_status(mutation_status_series):
     # gemrline, somatic, unknown
     return mutation_status_series.str.lower().where(mutation_status_series.str.lower().isin(['germline', 'somatic']), 'unknown')
 
-def count_unique_patients_per_vue(vue, variant_to_sample, sample_to_mutation_status, sample_to_patient, sample_to_cancer_type):
-    sample_ids = variant_to_sample.get(vue, [])
-    df = pd.DataFrame({'sample_id': sample_ids})
-
-    # mutation status category: gemrline, somatic, unknown
-    raw_status = df['sample_id'].map(sample_to_mutation_status).fillna('unknown').str.lower()
-    df['status'] = raw_status.where(raw_status.isin(['germline', 'somatic']), 'unknown')
-
-    df['patient_id'] = df['sample_id'].map(sample_to_patient)
-    df['cancer_type'] = df['sample_id'].map(sample_to_cancer_type)
-
-    df = df.dropna(subset=['patient_id'])
-
-    counts = {
-        'germlineVariantsCount': 0,
-        'somaticVariantsCount': 0,
-        'unknownVariantsCount': 0,
-        'germlineVariantsCountByCancerType': {},
-        'somaticVariantsCountByCancerType': {},
-        'unknownVariantsCountByCancerType': {}
-    }
-
-    for status in ['germline', 'somatic', 'unknown']:
-        group = df[df['status'] == status].drop_duplicates('patient_id')
-        counts[f'{status}VariantsCount'] = len(group)
-
-        counts_by_cancer_type = group.groupby('cancer_type')['patient_id'].nunique()
-        counts[f'{status}VariantsCountByCancerType'] = counts_by_cancer_type.to_dict()
-
+def build_match_table(matches, sample_to_patient, sample_to_cancer_type):
+    """One row per (vue, sample) match with the sample's status category, patient and cancer type.
+
+    A sample has one mutation status, that of its last matched row, and all its matches are counted under it.
+    """
+    table = matches[['vue', 'sample_id']].copy()
+    sample_to_mutation_status = matches.drop_duplicates('sample_id', keep='last').set_index('sample_id')['mutation_status']
+    raw_status = table['sample_id'].map(sample_to_mutation_status).fillna('unknown').astype(str)
+    table['status'] = categorize_mutation_status(raw_status)
+
+    table['patient_id'] = table['sample_id'].map(sample_to_patient)
+    table['cancer_type'] = table['sample_id'].map(sample_to_cancer_type)
+
+    return table.dropna(subset=['patient_id'])
+
+def count_unique_patients(match_table, vues, total_patients, gene_patient_counts=None):
+    """Count unique patients per VUE and status, overall and by cancer type, in one groupby pass.
+
+    genePatientCount is the number of patients whose panel covers the VUE (gene_patient_counts),
+    or total_patients if no panel coverage is given.
+    """
+    # A patient is counted once per status, under the cancer type of its first matched sample
+    deduped = match_table.drop_duplicates(['vue', 'status', 'patient_id'])
+    counts_by_status = deduped.groupby(['vue', 'status']).size()
+    counts_by_cancer_type = deduped.dropna(subset=['cancer_type']).groupby(['vue', 'status', 'cancer_type']).size()
+
+    counts = {vue: match_store.empty_vue_counts(total_patients) for vue in vues}
+    if gene_patient_counts is not None:
+        for vue in vues:
+            counts[vue]['genePatientCount'] = gene_patient_counts[vue]
+    for (vue, status), count in counts_by_status.items():
+        counts[vue][f'{status}VariantsCount'] = int(count)
+    for (vue, status, cancer_type), count in counts_by_cancer_type.items():
+        counts[vue][f'{status}VariantsCountByCancerType'][cancer_type] = int(count)
     return counts
 
-def add_vue_counts(vue_df,
-                       variant_to_sample,
-                       sample_to_mutation_status,
-                       sample_to_cancer_type,
-                       sample_to_patient,
-                       clinical_df):
-    vue_df = vue_df.copy()
-    total_patients = clinical_df['PATIENT_ID'].nunique()
-
-    vue_df['count'] = vue_df.index.to_series().apply(
-        lambda vue: {
-            **count_unique_patients_per_vue(
-                vue,
-                variant_to_sample,
-                sample_to_mutation_status,
-                sample_to_patient,
-                sample_to_cancer_type
-            ),
-            'totalPatientCount': total_patients
-        }
-    )
-
-    return vue_df
-
-def merge_sample_maps(sample_maps_by_cohort):
-    return dict(chain.from_iterable(d.items() for d in sample_maps_by_cohort.values()))
-
-def update_vue_counts_json(vues_json, vue_df):
+def add_vue_counts(vue_df, matches, sample_to_cancer_type, sample_to_patient, total_patients, gene_patient_counts=None):
+    """Counts for every VUE in vue_df, keyed by genomicLocation."""
+    match_table = build_match_table(matches, sample_to_patient, sample_to_cancer_type)
+    match_table = match_table[match_table['vue'].isin(vue_df.index)]
+    return count_unique_patients(match_table, vue_df.index, total_patients, gene_patient_counts)
+
+def load_panel_index(path):
+    """Panel interval index for gene_panels.count_covered_patients, with the fingerprint of its source file."""
+    index = gene_panels.build_panel_index(gene_panels.read_panel_intervals(path))
+    index["source"] = cohort_cache.file_fingerprint(path)
+    return index
+
+def update_vue_counts_json(vues_json, vue_df, oncokb_options=None):
+    # fetch therapeutic level and oncogenicity from OncoKB for all counted VUEs at once
+    with stage_trace.stage("oncokb_annotation") as counters:
+        genomic_locations = [
+            vue.get("genomicLocation") for gene in vues_json for vue in gene.get("revisedProteinEffects", [])
+            if vue.get("genomicLocation") in vue_df.index
+        ]
+        annotations = oncokb_client.annotate_genomic_locations(genomic_locations, **(oncokb_options or {}))
+        counters["rows"] = len(genomic_locations)
     for gene in vues_json:
         for vue in gene.get("revisedProteinEffects", []):
             vue_genomic_location = vue.get("genomicLocation")
@@ -192,7 +299,7 @@ def update_vue_counts_json(vues_json, vue_df):
                 if "counts" in vue:
                     del vue["counts"]
                 vue["counts"] = counts_by_cohort
-                vue["therapeuticLevel"], vue["oncogenic"] = get_therapeutic_level(vue_genomic_location)
+                vue["therapeuticLevel"], vue["oncogenic"] = annotations[vue_genomic_location]
     return vues_json
 
 cohorts = {
@@ -207,101 +314,285 @@ cohorts = {
     "genie": {
         "clinical_path": "./files/genie/genie_data_clinical_sample.txt",
         "mutation_path": "./files/genie/genie_data_mutations_extended.txt"
+    },
+    # TCGA Pan-Cancer is one cohort made of all the study file pairs in this folder
+    "tcga": {
+        "folder": "./files/tcga"
     }
 }
-# Utility to merge multiple sample maps
-def merge_sample_maps(sample_maps_by_cohort):
-    return dict(chain.from_iterable(d.items() for d in sample_maps_by_cohort.values()))
-
-# Cohort processing wrapper
-def process_and_count_cohort(name, clinical_path, mutation_path, vue_df, target_gene_panels_by_cohort):
-    clinical_df = read_clinical_df(clinical_path, name, target_gene_panels_by_cohort)
-    mutation_df = read_mutation_df(mutation_path)
-    variant_to_sample, sample_to_mutation_status, sample_to_patient, sample_to_cancer_type = process_cohort(
-        clinical_df, mutation_df, vue_df
-    )
-    vue_df[f'count_{name}'] = add_vue_counts(
-        vue_df=vue_df,
-        variant_to_sample=variant_to_sample,
-        sample_to_mutation_status=sample_to_mutation_status,
-        sample_to_cancer_type=sample_to_cancer_type,
-        sample_to_patient=sample_to_patient,
-        clinical_df=clinical_df
-    )['count']
-    return {
-        "variant_to_sample": variant_to_sample,
-        "sample_to_mutation_status": sample_to_mutation_status,
+
+# Cohort processing wrapper, runs in a worker process when --workers > 1
+def process_and_count_cohort(name, paths, vue_df, target_gene_panels_by_cohort, cache_dir=None, match_mode='exact',
+                             panel_index=None, trace_origin=None):
+    """Read and count one cohort. Returns its counts and the compact sample maps needed for the total.
+
+    With a panel_index, genePatientCount only counts patients with a sample on a panel covering the VUE.
+
+    With a trace_origin (tracing enabled in the parent), the stage events recorded for this cohort
+    are returned as "trace_events", so they can be sent back from a worker process.
+    """
+    if trace_origin is not None:
+        stage_trace.enable(trace_origin)
+    with stage_trace.collect_events() as trace_events, stage_trace.stage("cohort", cohort=name):
+        if "folder" in paths:
+            clinical_df, mutation_df = read_all_tcga(
+                paths["folder"], vue_keys=vue_df.index, cache_dir=cache_dir, match_mode=match_mode
+            )
+        else:
+            clinical_df = read_clinical_df(paths["clinical_path"], name, target_gene_panels_by_cohort, cache_dir=cache_dir)
+            mutation_df = read_mutation_df(
+                paths["mutation_path"], vue_keys=vue_df.index, cache_dir=cache_dir, match_mode=match_mode
+            )
+        with stage_trace.stage("match", cohort=name) as counters:
+            matches, sample_to_patient, sample_to_cancer_type = process_cohort(clinical_df, mutation_df, vue_df)
+            counters["rows"], counters["matched_rows"] = len(mutation_df), len(matches)
+        with stage_trace.stage("count", cohort=name) as counters:
+            counts = add_vue_counts(
+                vue_df=vue_df,
+                matches=matches,
+                sample_to_cancer_type=sample_to_cancer_type,
+                sample_to_patient=sample_to_patient,
+                total_patients=clinical_df['PATIENT_ID'].nunique(),
+                gene_patient_counts=gene_panels.count_covered_patients(
+                    panel_index, vue_df.index, clinical_df['PATIENT_ID'], clinical_df['PANEL']
+                )
+            )
+            counters["rows"] = len(counts)
+        patient_panels = clinical_df[['PATIENT_ID', 'PANEL']].dropna(subset=['PATIENT_ID']).drop_duplicates()
+        patient_cancer_types = clinical_df[['PATIENT_ID', 'CANCER_TYPE']].dropna().drop_duplicates()
+    result = {
+        "counts": counts,
+        "matches": matches,
         "sample_to_patient": sample_to_patient,
         "sample_to_cancer_type": sample_to_cancer_type,
-        "clinical_df": clinical_df
+        "patient_ids": clinical_df['PATIENT_ID'].dropna().unique().tolist(),
+        "patient_panels": patient_panels.astype(object).where(patient_panels.notna(), None).values.tolist(),
+        "patient_cancer_types": patient_cancer_types.values.tolist()
+    }
+    if trace_origin is not None:
+        result["trace_events"] = trace_events
+    return result
+
+# Incremental mode: per-cohort results are kept in a state file with a fingerprint of the
+# cohort inputs, and only VUEs that are new (or all VUEs of a changed cohort) are counted
+count_state_version = 4
+
+def cohort_input_paths(paths):
+    if "folder" in paths:
+        return list(chain.from_iterable(find_tcga_file_pairs(paths["folder"])))
+    return [paths["clinical_path"], paths["mutation_path"]]
+
+def cohort_input_fingerprint(name, paths, match_mode='exact', panel_index=None):
+    return {
+        "version": count_state_version,
+        "match_mode": match_mode,
+        "gene_panels": target_gene_panels_by_cohorts.get(name),
+        "gene_panel_definitions": panel_index["source"] if panel_index else None,
+        "files": [cohort_cache.file_fingerprint(path) for path in cohort_input_paths(paths)]
     }
 
-# Prepare containers
-all_variant_to_sample = {}
-all_sample_to_mutation_status = {}
-all_sample_to_patient = {}
-all_sample_to_cancer_type = {}
-all_clinical_dfs = []
-
-# Process standard cohorts
-for cohort_name, paths in cohorts.items():
-    result = process_and_count_cohort(
-        name=cohort_name,
-        clinical_path=paths["clinical_path"],
-        mutation_path=paths["mutation_path"],
-        vue_df=vue_df,
-        target_gene_panels_by_cohort=target_gene_panels_by_cohorts
+def load_count_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("version") != count_state_version:
+        return {}
+    cohort_cache.digests.update({key: entry for key, entry in state.get("digests", {}).items() if key not in cohort_cache.digests})
+    return {
+        name: {**result, "matches": pd.DataFrame(result["matches"], columns=['vue', 'sample_id', 'mutation_status', 'row'])}
+        for name, result in state["cohorts"].items()
+    }
+
+def save_count_state(path, results_by_cohort):
+    state = {
+        "version": count_state_version,
+        "cohorts": {
+            name: {**result, "matches": result["matches"].to_dict(orient='list')}
+            for name, result in results_by_cohort.items()
+        },
+        "digests": cohort_cache.digests
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def merge_cohort_results(previous, new, vue_df):
+    """Previous results restricted to the current VUEs, plus the results for newly counted VUEs.
+
+    A sample's mutation status comes from its last matched row over all VUEs, so adding or removing
+    VUEs can change the counts of the others: every VUE is counted again from the merged matches,
+    put back in file order.
+    """
+    matches = previous["matches"][previous["matches"]['vue'].isin(vue_df.index)]
+    sample_to_patient = previous["sample_to_patient"]
+    gene_patient_counts = {vue: counts['genePatientCount'] for vue, counts in previous["counts"].items()}
+    if new is not None:
+        matches = pd.concat([matches, new["matches"]], ignore_index=True)
+        sample_to_patient = {**sample_to_patient, **new["sample_to_patient"]}
+        gene_patient_counts.update({vue: counts['genePatientCount'] for vue, counts in new["counts"].items()})
+    matches = matches.sort_values('row', kind='stable', ignore_index=True)
+    # As in a full run, only the matched samples are mapped to their patient
+    matched_samples = set(matches['sample_id'])
+    sample_to_patient = {sample: patient for sample, patient in sample_to_patient.items() if sample in matched_samples}
+    counts = add_vue_counts(
+        vue_df, matches, previous["sample_to_cancer_type"], sample_to_patient, len(previous["patient_ids"]),
+        gene_patient_counts
     )
-    all_variant_to_sample[cohort_name] = result["variant_to_sample"]
-    all_sample_to_mutation_status[cohort_name] = result["sample_to_mutation_status"]
-    all_sample_to_patient[cohort_name] = result["sample_to_patient"]
-    all_sample_to_cancer_type[cohort_name] = result["sample_to_cancer_type"]
-    all_clinical_dfs.append(result["clinical_df"][['PATIENT_ID']])
-
-# Handle TCGA separately
-tcga_clinical_df, tcga_mutation_df = read_all_tcga("./files/tcga")
-tcga_variant_to_sample, tcga_sample_to_mutation_status, tcga_sample_to_patient, tcga_sample_to_cancer_type = process_cohort(
-    tcga_clinical_df, tcga_mutation_df, vue_df
-)
-vue_df['count_tcga'] = add_vue_counts(
-    vue_df=vue_df,
-    variant_to_sample=tcga_variant_to_sample,
-    sample_to_mutation_status=tcga_sample_to_mutation_status,
-    sample_to_cancer_type=tcga_sample_to_cancer_type,
-    sample_to_patient=tcga_sample_to_patient,
-    clinical_df=tcga_clinical_df
-)['count']
-
-# Include TCGA in total maps
-all_variant_to_sample["tcga"] = tcga_variant_to_sample
-all_sample_to_mutation_status["tcga"] = tcga_sample_to_mutation_status
-all_sample_to_patient["tcga"] = tcga_sample_to_patient
-all_sample_to_cancer_type["tcga"] = tcga_sample_to_cancer_type
-all_clinical_dfs.append(tcga_clinical_df[['PATIENT_ID']])
-
-# Compute total (merged) counts
-total_variant_to_sample = {}
-for cohort_map in all_variant_to_sample.values():
-    for vue, samples in cohort_map.items():
-        total_variant_to_sample.setdefault(vue, []).extend(samples)
-
-total_sample_to_mutation_status = merge_sample_maps(all_sample_to_mutation_status)
-total_sample_to_patient = merge_sample_maps(all_sample_to_patient)
-total_sample_to_cancer_type = merge_sample_maps(all_sample_to_cancer_type)
-total_clinical_df = pd.concat(all_clinical_dfs, ignore_index=True).drop_duplicates()
-
-vue_df['count_total'] = add_vue_counts(
-    vue_df=vue_df,
-    variant_to_sample=total_variant_to_sample,
-    sample_to_mutation_status=total_sample_to_mutation_status,
-    sample_to_cancer_type=total_sample_to_cancer_type,
-    sample_to_patient=total_sample_to_patient,
-    clinical_df=total_clinical_df
-)['count']
-
-
-with open("../generated/VUEs.json", "r", encoding="utf-8") as f:
-    original_vues = json.load(f)
-
-with open("../generated/VUEs.json", "w", encoding="utf-8") as f:
-    json.dump(update_vue_counts_json(original_vues, vue_df), f, indent=2, ensure_ascii=False)
+    return {**previous, "counts": counts, "matches": matches, "sample_to_patient": sample_to_patient}
+
+def run_cohorts(vue_df, workers, cache_dir=None, state=None, match_mode='exact', panel_index=None):
+    """Count every cohort, in a process pool when workers > 1. Results come back in cohort order.
+
+    With a state (incremental mode), a cohort whose inputs are unchanged is only counted for
+    VUEs missing from its previous results, and is not read at all if there are none.
+    """
+    vue_df_by_cohort = {}
+    previous_by_cohort = {}
+    fingerprints = {}
+    for name, paths in cohorts.items():
+        vue_df_by_cohort[name] = vue_df
+        if state is None:
+            continue
+        fingerprints[name] = cohort_input_fingerprint(name, paths, match_mode, panel_index)
+        previous = state.get(name)
+        if previous is not None and previous["fingerprint"] == fingerprints[name]:
+            previous_by_cohort[name] = previous
+            vue_df_by_cohort[name] = vue_df[~vue_df.index.isin(list(previous["counts"]))]
+
+    names = [name for name in cohorts if len(vue_df_by_cohort[name]) or name not in previous_by_cohort]
+    args = [
+        (name, cohorts[name], vue_df_by_cohort[name], target_gene_panels_by_cohorts, cache_dir, match_mode,
+         panel_index, stage_trace.origin())
+        for name in names
+    ]
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(args))) as executor:
+            results = list(executor.map(process_and_count_cohort, *zip(*args)))
+    else:
+        results = [process_and_count_cohort(*arg) for arg in args]
+    for result in results:
+        stage_trace.add_events(result.pop("trace_events", []))
+    counted = dict(zip(names, results))
+
+    results_by_cohort = {}
+    for name in cohorts:
+        if name in previous_by_cohort:
+            results_by_cohort[name] = merge_cohort_results(previous_by_cohort[name], counted.get(name), vue_df)
+        else:
+            results_by_cohort[name] = counted[name]
+        if state is not None:
+            results_by_cohort[name]["fingerprint"] = fingerprints[name]
+    return results_by_cohort
+
+def count_total(vue_df, store, panel_index=None):
+    """Unique-patient counts over all cohorts in the match store, merged in cohort order."""
+    with stage_trace.stage("merge", cohort="total") as counters:
+        counters["matched_rows"] = sum(len(cohort['vue']) for cohort in store["cohorts"].values())
+        return match_store.count_patients(store, list(store["cohorts"]), vue_df.index, panel_index)
+
+def main():
+    parser = argparse.ArgumentParser(description="Count reVUE variants in each cohort and update VUEs.json.")
+    parser.add_argument("--input", default=vues_json_path, help="VUEs.json to count (default: %(default)s)")
+    parser.add_argument("--output",
+                        help="Write the updated VUEs.json (and its .idx lookup) here (default: update --input in place)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of cohorts to read and count in parallel processes (default: 1, serial)")
+    parser.add_argument("--cache-dir",
+                        help="Cache parsed, column-pruned cohort tables here as Parquet (requires pyarrow)")
+    parser.add_argument("--state",
+                        help="Incremental mode: keep per-cohort results in this file and only count new VUEs "
+                             "or cohorts whose input files changed")
+    parser.add_argument("--match-mode", choices=interval_index.match_modes, default="exact",
+                        help="How mutations are matched to VUEs: exact key, normalized alleles, "
+                             "or overlapping intervals (default: exact)")
+    parser.add_argument("--oncokb-url", default=oncokb_client.default_base_url,
+                        help="OncoKB API base URL (default: %(default)s)")
+    parser.add_argument("--oncokb-workers", type=int, default=4,
+                        help="Number of concurrent OncoKB requests (default: 4)")
+    parser.add_argument("--oncokb-cache",
+                        help="On-disk cache of OncoKB annotations, reused for --oncokb-cache-ttl hours")
+    parser.add_argument("--oncokb-cache-ttl", type=float, default=24 * 7,
+                        help="Hours before a cached OncoKB annotation is fetched again (default: 168)")
+    parser.add_argument("--gene-panels", default=gene_panels_path,
+                        help="Gene panel definitions (GENIE genomic_information.txt) for genePatientCount; "
+                             "without it genePatientCount is totalPatientCount (default: %(default)s, if it exists)")
+    parser.add_argument("--match-store",
+                        help="Save every cohort's matches here (.npz) so any combination of cohorts can be "
+                             "counted later with match_store.py")
+    parser.add_argument("--count-cube",
+                        help="Write VUE x cohort x status x cancer type patient counts here (.parquet, needs pyarrow) "
+                             "for count_cube.py queries")
+    parser.add_argument("--no-lookup", action="store_true",
+                        help="Do not write the binary lookup file (VUEs.idx) next to the output")
+    parser.add_argument("--shards",
+                        help="Also write one JSON file per gene and a manifest to this directory "
+                             "(e.g. ../generated/genes); only changed genes are rewritten")
+    parser.add_argument("--trace",
+                        help="Record per-stage time, memory, row counts and HTTP calls to this trace-event JSON file "
+                             "and print a summary")
+    args = parser.parse_args()
+    output_path = args.output or args.input
+    if args.trace:
+        stage_trace.enable()
+    oncokb_options = {
+        "base_url": args.oncokb_url,
+        "workers": args.oncokb_workers,
+        "cache_path": args.oncokb_cache,
+        "cache_ttl": args.oncokb_cache_ttl * 3600
+    }
+
+    with stage_trace.stage("load_vues") as counters:
+        vue_df = load_vue_df(args.input)
+        counters["rows"] = len(vue_df)
+    # The state and the cache hold the file digests, so they are loaded before any input is fingerprinted
+    state = load_count_state(args.state) if args.state else None
+    if args.cache_dir:
+        cohort_cache.load_digests(os.path.join(args.cache_dir, cohort_cache.digests_name))
+    panel_index = None
+    if os.path.exists(args.gene_panels):
+        with stage_trace.stage("load_gene_panels"):
+            panel_index = load_panel_index(args.gene_panels)
+    results_by_cohort = run_cohorts(vue_df, args.workers, args.cache_dir, state, args.match_mode, panel_index)
+    if args.state:
+        save_count_state(args.state, results_by_cohort)
+    if args.cache_dir:
+        os.makedirs(args.cache_dir, exist_ok=True)
+        cohort_cache.save_digests(os.path.join(args.cache_dir, cohort_cache.digests_name))
+
+    for name, result in results_by_cohort.items():
+        vue_df[f'count_{name}'] = [result["counts"][vue] for vue in vue_df.index]
+    store = match_store.build_match_store(results_by_cohort)
+    if args.match_store:
+        match_store.save_match_store(store, args.match_store)
+    total_counts = count_total(vue_df, store, panel_index)
+    vue_df['count_total'] = [total_counts[vue] for vue in vue_df.index]
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        original_vues = json.load(f)
+    if args.count_cube:
+        with stage_trace.stage("count_cube") as counters:
+            cube = count_cube.build_count_cube(store, original_vues, panel_index)
+            count_cube.write_count_cube(cube, args.count_cube)
+            counters["rows"] = len(cube["counts"])
+
+    updated_vues = update_vue_counts_json(original_vues, vue_df, oncokb_options)
+    with stage_trace.stage("write_json"):
+        # Written to a temporary file and renamed, so a failed run never leaves a partial VUEs.json
+        with open(f"{output_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(updated_vues, f, indent=2, ensure_ascii=False)
+        os.replace(f"{output_path}.tmp", output_path)
+        if not args.no_lookup:
+            vue_lookup.write_lookup(updated_vues, vue_lookup.lookup_path_for(output_path))
+    if args.shards:
+        with stage_trace.stage("write_shards") as counters:
+            changes = vue_shards.write_shards(updated_vues, args.shards)
+            counters["rows"] = len(changes["written"])
+
+    if args.trace:
+        stage_trace.write_trace(args.trace)
+        print(stage_trace.format_summary(), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+
+# Compact, memory-mappable lookup artifact written next to generated/VUEs.json.
+#
+# Layout (little-endian, sections aligned to 8 bytes):
+#   header      magic, version, record count, table count, gene count and section positions
+#   tables      per key type: name, entry count and the positions of its three sections
+#   records     uint64 offsets[n + 1] + blob of zlib-compressed UTF-8 JSON, one VUE object per record
+#   record genes  uint32 gene id of each record
+#   genes       uint64 offsets[genes + 1] + blob of zlib-compressed UTF-8 JSON, one gene object
+#               (without revisedProteinEffects) per gene, stored once for all of its VUEs
+#   per table   uint64 key offsets[count + 1], uint32 record ids[count], UTF-8 key blob
+# Keys in a table are sorted by their UTF-8 bytes, so a lookup is a binary search that only
+# reads the probed keys; records are decompressed and decoded when they are accessed.
+#
+#   lookup = open_lookup('../generated/VUEs.idx')
+#   is_vue(lookup, '7,116412044,116412044,G,A')
+#   find(lookup, 'gene', 'MET')
+
+magic = b'REVUEIDX'
+format_version = 2
+header_format = '<8sIIIIQQQQQ'
+table_format = '<24sQQQQ'
+
+# key type -> function returning the keys of one VUE
+key_types = {
+    'genomicLocation': lambda gene, vue: [vue.get('genomicLocation')],
+    'hgvsg': lambda gene, vue: [vue.get('variant')],
+    'hgvsc': lambda gene, vue: [vue.get('hgvsc')],
+    'gene': lambda gene, vue: [gene.get('hugoGeneSymbol')],
+    'transcript': lambda gene, vue: [vue.get('transcriptId') or gene.get('transcriptId')]
+}
+
+def align(f):
+    f.write(b'\0' * (-f.tell() % 8))
+    return f.tell()
+
+def write_blob(f, values):
+    """Write uint64 offsets[n + 1] followed by the concatenated values. Returns both positions."""
+    offsets = np.zeros(len(values) + 1, dtype='<u8')
+    offsets[1:] = np.cumsum([len(value) for value in values])
+    offsets_at = align(f)
+    f.write(offsets.tobytes())
+    blob_at = align(f)
+    f.write(b''.join(values))
+    return offsets_at, blob_at
+
+def encode_record(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 9)
+
+def decode_record(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+def write_lookup(vues_json, path):
+    """Write the lookup artifact for a VUEs.json structure to path, atomically."""
+    records = []
+    record_genes = []
+    genes = []
+    entries = {key_type: [] for key_type in key_types}
+    for gene in vues_json:
+        gene_fields = {key: value for key, value in gene.items() if key != 'revisedProteinEffects'}
+        genes.append(encode_record(gene_fields))
+        for vue in gene.get('revisedProteinEffects', []):
+            record_id = len(records)
+            records.append(encode_record(vue))
+            record_genes.append(len(genes) - 1)
+            for key_type, get_keys in key_types.items():
+                entries[key_type].extend(
+                    (key.encode('utf-8'), record_id) for key in get_keys(gene, vue) if key
+                )
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b'\0' * (struct.calcsize(header_format) + len(key_types) * struct.calcsize(table_format)))
+        record_offsets_at, records_at = write_blob(f, records)
+        record_genes_at = align(f)
+        f.write(np.array(record_genes, dtype='<u4').tobytes())
+        gene_offsets_at, genes_at = write_blob(f, genes)
+
+        tables = []
+        for key_type, key_entries in entries.items():
+            key_entries.sort()
+            key_offsets_at, keys_at = write_blob(f, [key for key, _ in key_entries])
+            record_ids_at = align(f)
+            f.write(np.array([record_id for _, record_id in key_entries], dtype='<u4').tobytes())
+            tables.append(struct.pack(
+                table_format, key_type.encode('ascii'), len(key_entries), key_offsets_at, record_ids_at, keys_at
+            ))
+
+        f.seek(0)
+        f.write(struct.pack(
+            header_format, magic, format_version, len(records), len(tables), len(genes),
+            record_offsets_at, records_at, record_genes_at, gene_offsets_at, genes_at
+        ))
+        f.write(b''.join(tables))
+    os.replace(tmp_path, path)
+
+def lookup_path_for(json_path):
+    return os.path.splitext(json_path)[0] + '.idx'
+
+def open_lookup(path):
+    """Memory-map a lookup artifact. Only the header is parsed; arrays are views into the mapping."""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    file_magic, version = struct.unpack_from('<8sI', buffer, 0)
+    if file_magic != magic or version != format_version:
+        raise ValueError(f"{path} is not a version {format_version} VUE lookup file")
+    (_, _, record_count, table_count, gene_count, record_offsets_at, records_at,
+     record_genes_at, gene_offsets_at, genes_at) = struct.unpack_from(header_format, buffer, 0)
+
+    tables = {}
+    position = struct.calcsize(header_format)
+    for _ in range(table_count):
+        name, count, key_offsets_at, record_ids_at, keys_at = struct.unpack_from(table_format, buffer, position)
+        position += struct.calcsize(table_format)
+        tables[name.rstrip(b'\0').decode('ascii')] = {
+            "count": count,
+            "key_offsets": np.frombuffer(buffer, dtype='<u8', count=count + 1, offset=key_offsets_at),
+            "record_ids": np.frombuffer(buffer, dtype='<u4', count=count, offset=record_ids_at),
+            "keys_at": keys_at
+        }
+
+    return {
+        "buffer": buffer,
+        "record_count": record_count,
+        "record_offsets": np.frombuffer(buffer, dtype='<u8', count=record_count + 1, offset=record_offsets_at),
+        "records_at": records_at,
+        "record_genes": np.frombuffer(buffer, dtype='<u4', count=record_count, offset=record_genes_at),
+        "gene_offsets": np.frombuffer(buffer, dtype='<u8', count=gene_count + 1, offset=gene_offsets_at),
+        "genes_at": genes_at,
+        "tables": tables
+    }
+
+def key_at(lookup, table, i):
+    start = table["keys_at"] + int(table["key_offsets"][i])
+    end = table["keys_at"] + int(table["key_offsets"][i + 1])
+    return lookup["buffer"][start:end]
+
+def find_record_ids(lookup, key_type, key):
+    """Ids of the records indexed under key, by binary search over the sorted keys."""
+    table = lookup["tables"][key_type]
+    key = key.encode('utf-8')
+    lo, hi = 0, table["count"]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key_at(lookup, table, mid) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    record_ids = []
+    while lo < table["count"] and key_at(lookup, table, lo) == key:
+        record_ids.append(int(table["record_ids"][lo]))
+        lo += 1
+    return record_ids
+
+def get_gene(lookup, gene_id):
+    start = lookup["genes_at"] + int(lookup["gene_offsets"][gene_id])
+    end = lookup["genes_at"] + int(lookup["gene_offsets"][gene_id + 1])
+    return decode_record(lookup["buffer"][start:end])
+
+def get_record(lookup, record_id):
+    """The {"gene": ..., "vue": ...} record with this id."""
+    start = lookup["records_at"] + int(lookup["record_offsets"][record_id])
+    end = lookup["records_at"] + int(lookup["record_offsets"][record_id + 1])
+    return {
+        "gene": get_gene(lookup, int(lookup["record_genes"][record_id])),
+        "vue": decode_record(lookup["buffer"][start:end])
+    }
+
+def find(lookup, key_type, key):
+    """Records indexed under key for key_type (genomicLocation, hgvsg, hgvsc, gene or transcript)."""
+    return [get_record(lookup, record_id) for record_id in find_record_ids(lookup, key_type, key)]
+
+def bulk_find(lookup, key_type, keys):
+    """Yield (key, records) for every key in an iterable; keys without a VUE yield an empty list."""
+    for key in keys:
+        yield key, find(lookup, key_type, key)
+
+def is_vue(lookup, genomic_location):
+    return bool(find_record_ids(lookup, 'genomicLocation', genomic_location))
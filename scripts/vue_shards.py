@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+# Optional per-gene layout of generated/VUEs.json, so clients can fetch and parse only the genes
+# they need. Each gene record is written to <dir>/<gene>.json and <dir>/manifest.json maps genes
+# to their shard, in VUEs.json order:
+#   {"version": 1, "genes": {"KIT": {"path": "KIT.json", "sha256": ..., "size": ..., "vues": 3}, ...}}
+# Shards whose content hash is unchanged are not rewritten, so a run only touches the genes whose
+# records changed. Shards of genes that are no longer in VUEs.json are removed.
+#
+# A shard is named after its gene. Genes with characters that are not safe in a file name, and
+# genes whose names differ only in case (which share a file on case-insensitive filesystems), get
+# a short hash of the gene symbol appended, so no two genes ever write the same shard.
+#
+#   write_shards(vues_json, '../generated/genes')
+#   load_gene('../generated/genes', 'KIT')
+
+manifest_version = 1
+manifest_name = 'manifest.json'
+
+def shard_name(gene, hashed=False):
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', gene)
+    if hashed or name != gene:
+        name = f"{name}-{hashlib.sha256(gene.encode('utf-8')).hexdigest()[:8]}"
+    return name + '.json'
+
+def shard_names(genes):
+    """{gene: shard file name}, with names that stay distinct when case is ignored."""
+    genes = list(dict.fromkeys(genes))
+    folded = Counter([shard_name(gene).lower() for gene in genes] + [manifest_name])
+    names = {gene: shard_name(gene, folded[shard_name(gene).lower()] > 1) for gene in genes}
+    folded = Counter([name.lower() for name in names.values()] + [manifest_name])
+    clashes = sorted(gene for gene, name in names.items() if folded[name.lower()] > 1)
+    if clashes:
+        raise ValueError(f"genes would share a shard file: {', '.join(clashes)}")
+    return names
+
+def serialize_gene(record):
+    return json.dumps(record, indent=2, ensure_ascii=False).encode('utf-8')
+
+def write_atomic(path, content):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def load_manifest(directory):
+    path = os.path.join(directory, manifest_name)
+    if not os.path.exists(path):
+        return {"version": manifest_version, "genes": {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_shards(vues_json, directory):
+    """Write one shard per gene and the manifest. Returns the genes written and removed."""
+    os.makedirs(directory, exist_ok=True)
+    previous = load_manifest(directory)["genes"]
+    names = shard_names(record["hugoGeneSymbol"] for record in vues_json)
+    genes = {}
+    written = []
+    for record in vues_json:
+        gene = record["hugoGeneSymbol"]
+        content = serialize_gene(record)
+        entry = {
+            "path": names[gene],
+            "sha256": hashlib.sha256(content).hexdigest(),
+            "size": len(content),
+            "vues": len(record.get("revisedProteinEffects", []))
+        }
+        path = os.path.join(directory, entry["path"])
+        old = previous.get(gene)
+        if old is None or old["sha256"] != entry["sha256"] or old["path"] != entry["path"] \
+                or not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+            write_atomic(path, content)
+            written.append(gene)
+        genes[gene] = entry
+
+    paths = {entry["path"] for entry in genes.values()}
+    removed = [gene for gene, entry in previous.items() if gene not in genes]
+    for entry in previous.values():
+        path = os.path.join(directory, entry["path"])
+        if entry["path"] not in paths and os.path.exists(path):
+            os.remove(path)
+
+    manifest = {"version": manifest_version, "genes": genes}
+    if written or removed or list(previous) != list(genes):
+        write_atomic(os.path.join(directory, manifest_name), json.dumps(manifest, indent=2).encode('utf-8'))
+    return {"written": written, "removed": removed}
+
+def load_gene(directory, gene, manifest=None):
+    """The VUEs.json record of one gene, or None if the gene has no shard."""
+    manifest = manifest or load_manifest(directory)
+    entry = manifest["genes"].get(gene)
+    if entry is None:
+        return None
+    with open(os.path.join(directory, entry["path"]), 'rb') as f:
+        content = f.read()
+    if hashlib.sha256(content).hexdigest() != entry["sha256"]:
+        raise ValueError(f"{gene} shard does not match the manifest hash")
+    return json.loads(content)